@@ -4,8 +4,17 @@ Enhanced API Documentation for OMR Sheet Checker
 This module provides detailed documentation, examples, and schemas for the API.
 """
 
+import textwrap
+from types import MappingProxyType
 from typing import Dict, Any
 
+# The tables below are read-only after import and wrapped in MappingProxyType
+# so they can be safely cached and shared.
+
+def _dedent(text: str) -> str:
+    """Strip source indentation from a multiline description"""
+    return textwrap.dedent(text).strip()
+
 # API Tags for organization
 TAGS_METADATA = [
     {
@@ -27,10 +36,10 @@ TAGS_METADATA = [
 ]
 
 # Detailed endpoint descriptions
-ENDPOINT_DESCRIPTIONS = {
+ENDPOINT_DESCRIPTIONS = MappingProxyType({
     "process_omr": {
         "summary": "Process OMR Sheet",
-        "description": """
+        "description": _dedent("""
         Process an OMR (Optical Mark Recognition) sheet image and extract marked answers.
         
         This endpoint accepts an image file of a filled OMR sheet and uses computer vision
@@ -55,7 +64,7 @@ ENDPOINT_DESCRIPTIONS = {
         3. Bubble detection and filtering
         4. Answer extraction with confidence scoring
         5. Result validation and metadata generation
-        """,
+        """),
         "responses": {
             200: {
                 "description": "Successful OMR processing",
@@ -63,7 +72,7 @@ ENDPOINT_DESCRIPTIONS = {
                     "application/json": {
                         "example": {
                             "status": "success",
-                            "result_id": "550e8400-e29b-41d4-a716-446655440000",
+                            "result_id": "550e8400e29b41d4a716446655440000",
                             "filename": "omr_sheet.jpg",
                             "timestamp": "2024-01-15T10:30:00",
                             "responses": {
@@ -89,6 +98,9 @@ ENDPOINT_DESCRIPTIONS = {
                                 "min_pixel_threshold_used": 500
                             }
                         }
+                    },
+                    "application/x-msgpack": {
+                        "description": "Same payload encoded as MessagePack, returned when the Accept header includes application/x-msgpack"
                     }
                 }
             },
@@ -138,7 +150,7 @@ ENDPOINT_DESCRIPTIONS = {
     },
     "health": {
         "summary": "Health Check",
-        "description": """
+        "description": _dedent("""
         Check the health and status of the OMR Sheet Checker service.
         
         This endpoint provides comprehensive health information including:
@@ -158,7 +170,7 @@ ENDPOINT_DESCRIPTIONS = {
         - Average response times
         - Files processed count
         - System resource usage
-        """,
+        """),
         "responses": {
             200: {
                 "description": "Service health information",
@@ -209,7 +221,7 @@ ENDPOINT_DESCRIPTIONS = {
     },
     "metrics": {
         "summary": "Performance Metrics",
-        "description": """
+        "description": _dedent("""
         Get detailed performance metrics and statistics.
         
         This endpoint provides comprehensive metrics for monitoring and analysis:
@@ -224,7 +236,7 @@ ENDPOINT_DESCRIPTIONS = {
         - Capacity planning and scaling decisions
         - Troubleshooting performance issues
         - SLA monitoring and reporting
-        """,
+        """),
         "responses": {
             200: {
                 "description": "Detailed performance metrics",
@@ -240,6 +252,8 @@ ENDPOINT_DESCRIPTIONS = {
                                     "total": 150,
                                     "success": 148,
                                     "errors": 2,
+                                    "client_errors": 2,
+                                    "server_errors": 0,
                                     "success_rate": 98.67
                                 },
                                 "response_times": {
@@ -251,6 +265,8 @@ ENDPOINT_DESCRIPTIONS = {
                                 "endpoints": {
                                     "/process_omr": {
                                         "count": 25,
+                                        "total_count": 25,
+                                        "lifetime_avg_time": 0.456,
                                         "avg_time": 0.456,
                                         "min_time": 0.234,
                                         "max_time": 1.123
@@ -273,15 +289,18 @@ ENDPOINT_DESCRIPTIONS = {
                                 }
                             }
                         }
+                    },
+                    "application/x-msgpack": {
+                        "description": "Same payload encoded as MessagePack, returned when the Accept header includes application/x-msgpack"
                     }
                 }
             }
         }
     }
-}
+})
 
 # Example request bodies
-EXAMPLE_REQUESTS = {
+EXAMPLE_REQUESTS = MappingProxyType({
     "process_omr": {
         "description": "Example OMR processing request",
         "curl": """
@@ -323,20 +342,20 @@ fetch('http://localhost:8000/process_omr', {
 .then(data => console.log(data));
         """
     }
-}
+})
 
 # Error codes and descriptions
-ERROR_CODES = {
+ERROR_CODES = MappingProxyType({
     400: "Bad Request - Invalid request parameters or file format",
     413: "Payload Too Large - File size exceeds 10MB limit",
     422: "Unprocessable Entity - OMR processing failed",
     429: "Too Many Requests - Rate limit exceeded",
     500: "Internal Server Error - Unexpected server error",
     503: "Service Unavailable - Service is unhealthy or unavailable"
-}
+})
 
 # Configuration options
-CONFIGURATION_OPTIONS = {
+CONFIGURATION_OPTIONS = MappingProxyType({
     "file_requirements": {
         "max_size": "10MB",
         "supported_formats": ["JPG", "PNG", "BMP"],
@@ -354,4 +373,4 @@ CONFIGURATION_OPTIONS = {
         "requests_per_hour": 1000,
         "file_size_limit": "10MB"
     }
-}
+})
@@ -1,52 +1,170 @@
+import atexit
 import logging
 import logging.handlers
 import os
-from datetime import datetime
-from typing import Dict, Any
-import json
+import queue
+import sys
+import time
+from typing import Dict, Any, List
+import orjson
+
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+
+class _LazyException:
+    """Exception info that is formatted when the log entry is serialized"""
+    
+    __slots__ = ("formatter", "record")
+    
+    def __init__(self, formatter: logging.Formatter, record: logging.LogRecord):
+        self.formatter = formatter
+        self.record = record
+    
+    def __str__(self) -> str:
+        # Cache on the record so every handler reuses one traceback formatting
+        record = self.record
+        if not record.exc_text:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+        return record.exc_text
 
 class StructuredFormatter(logging.Formatter):
-    """Custom formatter for structured JSON logging"""
+    """Custom formatter for structured JSON logging
+    
+    The "function" and "line" fields are only emitted when the record carries
+    caller information. Resolving it requires a stack walk per record, so it
+    can be disabled via setup_logging(include_source=False) at the cost of
+    losing these fields.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Second-resolution timestamp prefix, recomputed at most once per second
+        self._last_sec = 0
+        self._last_str = ""
+        # Interned level/logger/module/function names, a small fixed vocabulary
+        self._name_cache: Dict[str, str] = {}
+    
+    def _intern(self, value: str) -> str:
+        """Return the shared interned copy of a record name string"""
+        cached = self._name_cache.get(value)
+        if cached is None:
+            cached = self._name_cache[value] = sys.intern(value)
+        return cached
+    
+    def _timestamp(self, created: float) -> str:
+        """Format record creation time as ISO 8601 UTC with milliseconds"""
+        sec = int(created)
+        if sec != self._last_sec:
+            self._last_str = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+            self._last_sec = sec
+        return f"{self._last_str}.{int((created - sec) * 1000):03d}Z"
     
     def format(self, record: logging.LogRecord) -> str:
         # Create structured log entry
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "level": record.levelname,
-            "logger": record.name,
+            "timestamp": self._timestamp(record.created),
+            "level": self._intern(record.levelname),
+            "logger": self._intern(record.name),
             "message": record.getMessage(),
-            "module": record.module,
-            "function": record.funcName,
-            "line": record.lineno
+            "module": self._intern(record.module)
         }
         
+        # Add caller information if it was resolved
+        func_name = record.funcName
+        if func_name and func_name != "(unknown function)":
+            log_entry["function"] = self._intern(func_name)
+            log_entry["line"] = record.lineno
+        
         # Add extra fields if present
-        if hasattr(record, 'extra_fields'):
-            log_entry.update(record.extra_fields)
+        extra_fields = getattr(record, "extra_fields", None)
+        if extra_fields:
+            log_entry.update(extra_fields)
         
-        # Add exception info if present
+        # Add exception info if present; formatted only when serialized
         if record.exc_info:
-            log_entry["exception"] = self.formatException(record.exc_info)
+            log_entry["exception"] = _LazyException(self, record)
         
-        return json.dumps(log_entry)
+        # Extra fields may carry raw datetimes, UUIDs or numpy values; orjson
+        # encodes those natively and falls back to str() for anything else
+        return orjson.dumps(log_entry, default=str, option=_ORJSON_OPTIONS).decode()
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler for an in-process queue that keeps exception info for the formatters"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now so later mutation of the arguments can't change the message.
+        # The record is updated in place rather than copied: any other handler
+        # still sees the same message from getMessage().
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Log directories already created by this process
+_LOG_DIR_READY = set()
+
+# Logger that carries request/response access records
+ACCESS_LOGGER_NAME = "uvicorn.access"
+
+# Background listeners writing queued records to the real handlers
+_queue_listeners: List[logging.handlers.QueueListener] = []
+
+def _stop_queue_listeners() -> None:
+    """Flush pending records and stop the background listeners"""
+    while _queue_listeners:
+        listener = _queue_listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+def _start_queue_listener(logger: logging.Logger, *handlers: logging.Handler) -> None:
+    """Attach a queue to the logger and drain it into handlers on a background thread"""
+    # SimpleQueue is unbounded, C-implemented and skips task tracking, keeping put() cheap
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LocalQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _queue_listeners.append(listener)
+
+atexit.register(_stop_queue_listeners)
 
 def setup_logging(
     log_level: str = "INFO",
     log_dir: str = "logs",
     max_file_size: int = 10 * 1024 * 1024,  # 10MB
-    backup_count: int = 5
+    backup_count: int = 5,
+    include_source: bool = True
 ) -> None:
     """Setup comprehensive logging configuration"""
     
-    # Create logs directory if it doesn't exist
-    os.makedirs(log_dir, exist_ok=True)
+    # Skip per-record thread/process lookups, which are never emitted
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    
+    # Without a source file, Logger.findCaller returns early instead of walking the stack
+    if not include_source:
+        logging._srcfile = None
+    
+    # Create logs directory if it doesn't exist (once per process)
+    if log_dir not in _LOG_DIR_READY:
+        try:
+            os.makedirs(log_dir)
+        except FileExistsError:
+            pass
+        _LOG_DIR_READY.add(log_dir)
     
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level.upper()))
     
-    # Clear existing handlers
+    # Access records go to their own channel only instead of also hitting every root handler
+    access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    
+    # Clear existing handlers and stop listeners from a previous setup
+    _stop_queue_listeners()
     root_logger.handlers.clear()
+    access_logger.handlers.clear()
     
     # Console handler with colored output
     console_handler = logging.StreamHandler()
@@ -55,7 +173,6 @@ def setup_logging(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
     
     # File handler for all logs
     all_logs_handler = logging.handlers.RotatingFileHandler(
@@ -66,7 +183,6 @@ def setup_logging(
     all_logs_handler.setLevel(logging.DEBUG)
     all_logs_formatter = StructuredFormatter()
     all_logs_handler.setFormatter(all_logs_formatter)
-    root_logger.addHandler(all_logs_handler)
     
     # Error logs handler
     error_logs_handler = logging.handlers.RotatingFileHandler(
@@ -77,7 +193,6 @@ def setup_logging(
     error_logs_handler.setLevel(logging.ERROR)
     error_logs_formatter = StructuredFormatter()
     error_logs_handler.setFormatter(error_logs_formatter)
-    root_logger.addHandler(error_logs_handler)
     
     # Access logs handler
     access_logs_handler = logging.handlers.RotatingFileHandler(
@@ -88,34 +203,46 @@ def setup_logging(
     access_logs_handler.setLevel(logging.INFO)
     access_logs_formatter = StructuredFormatter()
     access_logs_handler.setFormatter(access_logs_formatter)
-    root_logger.addHandler(access_logs_handler)
+    
+    # Only enqueue on the calling thread; formatting and file writes happen
+    # on the listener threads so requests never block on log I/O
+    _start_queue_listener(
+        root_logger,
+        console_handler,
+        all_logs_handler,
+        error_logs_handler
+    )
+    _start_queue_listener(
+        access_logger,
+        console_handler,
+        access_logs_handler
+    )
 
 class LoggerMixin:
     """Mixin class to add structured logging capabilities"""
     
+    __slots__ = ("logger", "_is_enabled_for")
+    
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self._is_enabled_for = self.logger.isEnabledFor
+    
+    def _log(self, level: int, message: str, **extra_fields):
+        """Log message with extra fields, skipping record creation when filtered"""
+        if not self._is_enabled_for(level):
+            return
+        # stacklevel=3 attributes the record to the caller of log_info/log_error/log_warning
+        extra = {"extra_fields": extra_fields} if extra_fields else None
+        self.logger.log(level, message, extra=extra, stacklevel=3)
     
     def log_info(self, message: str, **extra_fields):
         """Log info message with extra fields"""
-        record = self.logger.makeRecord(
-            self.logger.name, logging.INFO, "", 0, message, (), None
-        )
-        record.extra_fields = extra_fields
-        self.logger.handle(record)
+        self._log(logging.INFO, message, **extra_fields)
     
     def log_error(self, message: str, **extra_fields):
         """Log error message with extra fields"""
-        record = self.logger.makeRecord(
-            self.logger.name, logging.ERROR, "", 0, message, (), None
-        )
-        record.extra_fields = extra_fields
-        self.logger.handle(record)
+        self._log(logging.ERROR, message, **extra_fields)
     
     def log_warning(self, message: str, **extra_fields):
         """Log warning message with extra fields"""
-        record = self.logger.makeRecord(
-            self.logger.name, logging.WARNING, "", 0, message, (), None
-        )
-        record.extra_fields = extra_fields
-        self.logger.handle(record)
+        self._log(logging.WARNING, message, **extra_fields)
@@ -1,23 +1,31 @@
+import asyncio
 import logging
+import multiprocessing
+import os
 import time
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Union
 from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+import orjson
 import uvicorn
-from datetime import datetime
 
 from .omr_processor import process_omr_sheet, validate_image_file, OMRProcessingError, FileValidationError
 from .result_store import result_store
 from .rate_limiter import rate_limiter
 from .security import security
-from .logging_config import setup_logging
-from .monitoring import performance_monitor
+from .logging_config import setup_logging, ACCESS_LOGGER_NAME
+from .monitoring import performance_monitor, UNMATCHED_ENDPOINT_ID
 from .docs import TAGS_METADATA, ENDPOINT_DESCRIPTIONS
+from .responses import MSGPACK_OPENAPI_RESPONSES, NEGOTIATED_HEADERS, accepts_msgpack, iso_now, iso_now_bytes, negotiated_response
 
 # Configure enhanced logging
 setup_logging(log_level="INFO", log_dir="logs")
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
 
 # Create FastAPI app with enhanced documentation
 app = FastAPI(
@@ -60,11 +68,80 @@ app = FastAPI(
     For more information, see the detailed endpoint documentation below.
     """,
     version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    openapi_tags=TAGS_METADATA
+    # Docs routes are registered at the bottom of this module so the schema
+    # can be serialized once after all endpoints exist
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
+    openapi_tags=TAGS_METADATA,
+    default_response_class=ORJSONResponse
 )
 
+# Uvicorn worker processes serving this app. One by default: the result store,
+# rate limiter and metrics live in process memory, so with more workers a result
+# is only found by the worker that stored it, each worker enforces the rate
+# limits separately and /metrics and /stats report a single worker. Setting
+# OMR_SERVER_WORKERS above 1 is an explicit opt-in to those limitations.
+SERVER_WORKERS = int(os.environ.get("OMR_SERVER_WORKERS", 1))
+
+# OMR worker processes per server worker; the cores are split across server
+# workers rather than each of them spawning a pool the size of the machine
+OMR_PROCESS_WORKERS = int(os.environ.get("OMR_PROCESS_WORKERS", max(1, (os.cpu_count() or 1) // SERVER_WORKERS)))
+
+# Workers are started from a clean forkserver rather than forked from the
+# running server, which already has the logging listener and other threads
+_OMR_MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+
+def _new_omr_executor() -> ProcessPoolExecutor:
+    """Create the OMR worker pool"""
+    return ProcessPoolExecutor(max_workers=OMR_PROCESS_WORKERS, mp_context=_OMR_MP_CONTEXT)
+
+
+# CPU-bound OMR processing runs in worker processes so the event loop stays responsive
+omr_executor = _new_omr_executor()
+
+
+async def run_omr_in_executor(*args) -> Dict[str, Any]:
+    """Run process_omr_sheet in the OMR pool, replacing the pool if a worker died"""
+    global omr_executor
+    executor = omr_executor
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, process_omr_sheet, *args)
+    except BrokenProcessPool:
+        # A killed worker breaks the whole pool for good; swap in a fresh one
+        # (once, for all requests that failed on it) so later requests succeed
+        if omr_executor is executor:
+            logger.error("OMR worker pool broken, starting a new one")
+            omr_executor = _new_omr_executor()
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+@app.on_event("startup")
+async def start_system_monitoring():
+    """Start background system metrics collection"""
+    app.state.system_monitor_task = asyncio.create_task(
+        performance_monitor.run_system_monitoring()
+    )
+    app.state.metrics_aggregation_task = asyncio.create_task(
+        performance_monitor.run_metrics_aggregation()
+    )
+
+
+@app.on_event("shutdown")
+async def stop_system_monitoring():
+    """Stop background system metrics collection"""
+    app.state.system_monitor_task.cancel()
+    app.state.metrics_aggregation_task.cancel()
+
+
+@app.on_event("shutdown")
+async def shutdown_omr_executor():
+    """Stop the OMR worker processes"""
+    omr_executor.shutdown(wait=False, cancel_futures=True)
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -74,151 +151,238 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Request logging and security middleware
-@app.middleware("http")
-async def log_requests_and_security(request: Request, call_next):
-    start_time = time.time()
-    
-    # Rate limiting check
-    is_allowed, limits_info = rate_limiter.is_allowed(request)
-    if not is_allowed:
-        logger.warning(f"Rate limit exceeded for {request.client.host}")
-        return JSONResponse(
-            status_code=429,
-            content={
-                "status": "error",
-                "message": "Rate limit exceeded. Please try again later.",
-                "limits": limits_info,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
-    
-    # Request size validation
-    content_length = request.headers.get("content-length")
-    if content_length and not security.check_request_size(int(content_length)):
-        logger.warning(f"Request too large from {request.client.host}")
-        return JSONResponse(
-            status_code=413,
-            content={
-                "status": "error",
-                "message": "Request too large. Maximum file size is 10MB.",
-                "timestamp": datetime.now().isoformat()
-            }
-        )
-    
-    # Log request with structured data
-    logger.info(
-        f"Request: {request.method} {request.url}",
-        extra={
-            "client_ip": request.client.host,
-            "user_agent": request.headers.get("user-agent"),
-            "content_length": content_length
-        }
+# Documentation endpoints get a more permissive CSP than the API
+DOC_PATHS = frozenset({"/docs", "/redoc", "/openapi.json"})
+DOC_PREFIXES = ("/docs/", "/redoc/")
+DOCS_CSP = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+    "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+    "img-src 'self' https://fastapi.tiangolo.com; "
+    "font-src 'self' https://cdn.jsdelivr.net; "
+    "connect-src 'self'"
+)
+
+# Raw (name, value) header pairs appended to every response
+DOCS_SECURITY_HEADERS = [
+    (b"content-security-policy", DOCS_CSP.encode("latin-1")),
+]
+API_SECURITY_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+]
+
+
+# Error bodies are filled into a bytes template; only the message is JSON-encoded per call
+_ERR_TEMPLATE = b'{"status":"error","message":%s,"timestamp":"%s"}'
+_INTERNAL_ERROR_MESSAGE = orjson.dumps("Internal server error")
+_REQUEST_TOO_LARGE_MESSAGE = orjson.dumps("Request too large. Maximum file size is 10MB.")
+
+
+def error_response(status_code: int, message_json: bytes) -> Response:
+    """Build an error response from an already JSON-encoded message"""
+    return Response(
+        content=_ERR_TEMPLATE % (message_json, iso_now_bytes()),
+        status_code=status_code,
+        media_type="application/json"
     )
+
+
+# Paths polled by orchestrator probes, exempt from rate limiting
+RATE_LIMIT_EXEMPT_PATHS = frozenset({"/health"})
+
+
+def _client_host(client) -> str:
+    """Client address from an ASGI scope's client tuple, only resolved for logging"""
+    return client[0] if client else "unknown"
+
+
+class RequestSecurityMiddleware:
+    """Request logging and security middleware
     
-    response = await call_next(request)
+    Implemented as plain ASGI middleware so each request is handled from the
+    raw scope and messages, without building Starlette Request/Response wrappers.
+    """
     
-    # Add basic security headers (simplified to avoid StreamingResponse issues)
-    try:
-        if "/docs" in str(request.url) or "/redoc" in str(request.url) or "/openapi.json" in str(request.url):
-            # More permissive CSP for documentation endpoints
-            response.headers["Content-Security-Policy"] = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-                "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-                "img-src 'self' https://fastapi.tiangolo.com; "
-                "font-src 'self' https://cdn.jsdelivr.net; "
-                "connect-src 'self'"
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_ns = time.perf_counter_ns()
+        headers = dict(scope["headers"])
+        client = scope.get("client")
+        path = scope["path"]
+        
+        # Rate limiting check; health probes are never throttled
+        if path in RATE_LIMIT_EXEMPT_PATHS:
+            is_allowed, limits_info = True, None
+        else:
+            is_allowed, limits_info = rate_limiter.is_allowed_asgi(headers, client)
+        if not is_allowed:
+            logger.warning(f"Rate limit exceeded for {_client_host(client)}")
+            response = ORJSONResponse(
+                status_code=429,
+                content={
+                    "status": "error",
+                    "message": "Rate limit exceeded. Please try again later.",
+                    "limits": limits_info,
+                    "timestamp": iso_now()
+                }
             )
+            await response(scope, receive, send)
+            return
+        
+        # Request size validation
+        content_length = headers.get(b"content-length")
+        if content_length and not security.check_request_size(int(content_length)):
+            logger.warning(f"Request too large from {_client_host(client)}")
+            response = error_response(413, _REQUEST_TOO_LARGE_MESSAGE)
+            await response(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        
+        # Log request with structured data; skip building the record when INFO is off
+        log_access = access_logger.isEnabledFor(logging.INFO)
+        if log_access:
+            user_agent = headers.get(b"user-agent")
+            access_logger.info(
+                "Request: %s %s",
+                method,
+                path,
+                extra={
+                    "client_ip": _client_host(client),
+                    "user_agent": user_agent.decode("latin-1") if user_agent else None,
+                    "content_length": content_length.decode("latin-1") if content_length else None
+                }
+            )
+        
+        # Documentation endpoints get a more permissive CSP, API endpoints basic security headers
+        if path in DOC_PATHS or path.startswith(DOC_PREFIXES):
+            security_headers = DOCS_SECURITY_HEADERS
         else:
-            # Basic security headers for API endpoints
-            response.headers["X-Content-Type-Options"] = "nosniff"
-            response.headers["X-Frame-Options"] = "DENY"
-            response.headers["X-XSS-Protection"] = "1; mode=block"
-    except Exception as e:
-        # If there's any issue with headers, just continue
-        logger.warning(f"Could not add security headers: {e}")
-    
-    # Calculate processing time
-    process_time = time.time() - start_time
-    
-    # Record metrics
-    performance_monitor.record_request(
-        endpoint=str(request.url.path),
-        method=request.method,
-        status_code=response.status_code,
-        response_time=process_time
-    )
-    
-    # Log response with structured data
-    logger.info(
-        f"Response: {response.status_code} - Process time: {process_time:.3f}s",
-        extra={
-            "status_code": response.status_code,
-            "process_time": process_time,
-            "client_ip": request.client.host
-        }
-    )
-    
-    return response
+            security_headers = API_SECURITY_HEADERS
+        status_code = 500
+        
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), *security_headers]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
+        
+        # Calculate processing time
+        process_time_ns = time.perf_counter_ns() - start_ns
+        
+        # Record metrics keyed by the matched route template ("/results/{result_id}"),
+        # so endpoint stats stay bounded by the route table; unmatched paths share one key
+        performance_monitor.record_request(
+            endpoint_id=getattr(scope.get("route"), "metrics_endpoint_id", UNMATCHED_ENDPOINT_ID),
+            method=method,
+            status_code=status_code,
+            response_time_ns=process_time_ns
+        )
+        
+        # Log response with structured data
+        if log_access:
+            process_time = process_time_ns / 1e9
+            access_logger.info(
+                "Response: %s - Process time: %.3fs",
+                status_code,
+                process_time,
+                extra={
+                    "status_code": status_code,
+                    "process_time": process_time,
+                    "client_ip": _client_host(client)
+                }
+            )
 
 
-@app.get("/", tags=["API Information"])
-async def root():
-    """Root endpoint with comprehensive API information"""
-    return {
-        "message": "OMR Sheet Checker API",
-        "version": "1.0.0",
-        "status": "running",
-        "timestamp": datetime.now().isoformat(),
-        "description": "AI-powered OMR sheet processing service with computer vision",
-        "features": [
-            "Image Processing (JPG, PNG, BMP)",
-            "Flexible Configuration",
-            "Enhanced Validation",
-            "Result Storage",
-            "Comprehensive Logging",
-            "Security Features",
-            "File Security"
-        ],
-        "security": {
-            "rate_limiting": "enabled",
-            "file_validation": "enabled",
-            "security_headers": "enabled",
-            "input_sanitization": "enabled"
+# Registered after CORS so it stays the outermost middleware
+app.add_middleware(RequestSecurityMiddleware)
+
+
+# Static part of the root response, serialized once; only the timestamp changes per call
+_ROOT_BODY = orjson.dumps({
+    "message": "OMR Sheet Checker API",
+    "version": "1.0.0",
+    "status": "running",
+    "description": "AI-powered OMR sheet processing service with computer vision",
+    "features": [
+        "Image Processing (JPG, PNG, BMP)",
+        "Flexible Configuration",
+        "Enhanced Validation",
+        "Result Storage",
+        "Comprehensive Logging",
+        "Security Features",
+        "File Security"
+    ],
+    "security": {
+        "rate_limiting": "enabled",
+        "file_validation": "enabled",
+        "security_headers": "enabled",
+        "input_sanitization": "enabled"
+    },
+    "endpoints": {
+        "omr_processing": {
+            "process_omr": "/process_omr"
         },
-        "endpoints": {
-            "omr_processing": {
-                "process_omr": "/process_omr"
-            },
-            "results": {
-                "get_result": "/results/{result_id}",
-                "delete_result": "/results/{result_id}"
-            },
-            "monitoring": {
-                "health": "/health",
-                "metrics": "/metrics",
-                "stats": "/stats"
-            },
-            "security": {
-                "rate_limits": "/security/limits"
-            },
-            "documentation": {
-                "swagger_ui": "/docs",
-                "redoc": "/redoc"
-            }
+        "results": {
+            "get_result": "/results/{result_id}",
+            "delete_result": "/results/{result_id}"
         },
-        "rate_limits": {
-            "requests_per_minute": 60,
-            "requests_per_hour": 1000,
-            "file_size_limit": "10MB"
+        "monitoring": {
+            "health": "/health",
+            "metrics": "/metrics",
+            "stats": "/stats"
         },
-        "supported_formats": ["JPG", "PNG", "BMP"]
-    }
+        "security": {
+            "rate_limits": "/security/limits"
+        },
+        "documentation": {
+            "swagger_ui": "/docs",
+            "redoc": "/redoc"
+        }
+    },
+    "rate_limits": {
+        "requests_per_minute": 60,
+        "requests_per_hour": 1000,
+        "file_size_limit": "10MB"
+    },
+    "supported_formats": ["JPG", "PNG", "BMP"]
+})[:-1]
 
 
-@app.post("/process_omr", tags=["OMR Processing"])
+@app.get("/", tags=["API Information"], response_class=ORJSONResponse)
+async def root():
+    """Root endpoint with comprehensive API information"""
+    return Response(
+        content=_ROOT_BODY + b',"timestamp":"' + iso_now_bytes() + b'"}',
+        media_type="application/json"
+    )
+
+
+async def _read_upload(file: UploadFile, chunk_size: int = 1024 * 1024) -> Union[bytes, bytearray]:
+    """Read an uploaded file, in a single call when its size is known"""
+    if file.size is not None:
+        # The size was already checked against the limit, so one read takes the whole body
+        return await file.read()
+    buffer = bytearray()
+    while chunk := await file.read(chunk_size):
+        buffer += chunk
+    return buffer
+
+
+@app.post("/process_omr", tags=["OMR Processing"], responses=MSGPACK_OPENAPI_RESPONSES)
 async def process_omr(
+    request: Request,
     file: UploadFile = File(..., description="OMR sheet image file (JPG, PNG, BMP)"),
     num_questions: int = Form(..., description="Total number of questions on the sheet", gt=0),
     num_options: int = Form(..., description="Number of options per question (e.g., 4 for A-D)", gt=0),
@@ -256,12 +420,16 @@ async def process_omr(
         if not security.validate_filename(file.filename):
             raise HTTPException(status_code=400, detail="Invalid filename detected")
         
-        # Validate content type
+        # Validate size and content type before reading the file back; the body has
+        # already been received (and spooled to disk if large), but a rejected upload
+        # is never copied into a buffer or handed to the OMR workers
+        if not security.check_request_size(file.size):
+            raise HTTPException(status_code=413, detail="File too large. Maximum file size is 10MB.")
         if not security.validate_content_type(file.content_type):
             raise HTTPException(status_code=400, detail="Invalid content type")
         
         # Read file content
-        file_content = await file.read()
+        file_content = await _read_upload(file)
         
         # Validate file
         is_valid, error_message = validate_image_file(file_content)
@@ -280,12 +448,12 @@ async def process_omr(
             }
         )
         
-        result = process_omr_sheet(
-            image_bytes=file_content,
-            num_questions=num_questions,
-            num_options=num_options,
-            min_pixel_threshold=min_pixel_threshold,
-            debug_mode=debug_mode
+        result = await run_omr_in_executor(
+            file_content,
+            num_questions,
+            num_options,
+            min_pixel_threshold,
+            debug_mode
         )
         
         # Record file processing metrics
@@ -295,7 +463,7 @@ async def process_omr(
         # Store result and get ID
         result_id = result_store.store_result({
             "filename": file.filename,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": iso_now(),
             **result
         })
         
@@ -304,12 +472,15 @@ async def process_omr(
             "status": "success",
             "result_id": result_id,
             "filename": file.filename,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": iso_now(),
             **result
         }
         
         logger.info(f"Successfully processed OMR sheet: {file.filename} with result ID: {result_id}")
-        return JSONResponse(content=response_data, status_code=200)
+        return negotiated_response(request, response_data)
+        
+    except HTTPException:
+        raise
         
     except FileValidationError as e:
         logger.error(f"File validation error: {str(e)}")
@@ -324,7 +495,20 @@ async def process_omr(
         raise HTTPException(status_code=500, detail="Internal server error during OMR processing")
 
 
-@app.get("/health", tags=["Monitoring"])
+# Pre-encoded pieces of the monitoring responses; only the dynamic payload is serialized per call
+_SUCCESS_PREFIX = b'{"status":"success","timestamp":"'
+_HEALTH_STATIC = b'",' + orjson.dumps({
+    "service": "OMR Sheet Checker API",
+    "version": "1.0.0"
+})[1:-1] + b','
+_HEALTH_DEPENDENCIES = {
+    "opencv": "available",
+    "numpy": "available",
+    "imutils": "available"
+}
+
+
+@app.get("/health", tags=["Monitoring"], response_class=ORJSONResponse)
 async def health_check():
     """
     Check the health and status of the OMR Sheet Checker service.
@@ -354,39 +538,40 @@ async def health_check():
         # Get performance metrics
         health_status = performance_monitor.get_health_status()
         
-        # Basic health check
+        # Basic health check; status, timestamp and the static fields are spliced in as bytes
         health_data = {
-            "status": health_status["status"],
-            "timestamp": datetime.now().isoformat(),
-            "service": "OMR Sheet Checker API",
-            "version": "1.0.0",
             "uptime_seconds": health_status["metrics"]["uptime_seconds"],
-            "dependencies": {
-                "opencv": "available",
-                "numpy": "available",
-                "imutils": "available"
-            },
+            "dependencies": _HEALTH_DEPENDENCIES,
             "result_store": result_store.get_stats(),
             "expired_results_cleaned": expired_count,
             "health_issues": health_status["issues"],
             "performance": {
-                "requests_total": health_status["metrics"]["requests"]["total"],
-                "success_rate": round(health_status["metrics"]["requests"]["success_rate"], 2),
-                "avg_response_time": round(health_status["metrics"]["response_times"]["avg"], 3),
-                "files_processed": health_status["metrics"]["file_processing"]["files_processed"]
+                "requests_total": health_status["metrics"]["requests_total"],
+                "success_rate": round(health_status["metrics"]["success_rate"], 2),
+                "avg_response_time": round(health_status["metrics"]["avg_response_time"], 3),
+                "files_processed": health_status["metrics"]["files_processed"]
             }
         }
         
+        body = (
+            b'{"status":"'
+            + health_status["status"].encode()
+            + b'","timestamp":"'
+            + iso_now_bytes()
+            + _HEALTH_STATIC
+            + orjson.dumps(health_data)[1:]
+        )
+        
         logger.info("Health check requested", extra={"health_status": health_status["status"]})
-        return health_data
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
 
-@app.get("/metrics", tags=["Monitoring"])
-async def get_metrics():
+@app.get("/metrics", tags=["Monitoring"], response_class=ORJSONResponse, responses=MSGPACK_OPENAPI_RESPONSES)
+async def get_metrics(request: Request):
     """
     Get detailed performance metrics and statistics.
     
@@ -404,21 +589,30 @@ async def get_metrics():
     - SLA monitoring and reporting
     """
     try:
-        metrics = performance_monitor.get_metrics()
-        
         logger.info("Metrics requested")
-        return {
-            "status": "success",
-            "timestamp": datetime.now().isoformat(),
-            "metrics": metrics
-        }
+        if accepts_msgpack(request):
+            return negotiated_response(request, {
+                "status": "success",
+                "timestamp": iso_now(),
+                "metrics": performance_monitor.get_metrics()
+            })
+        
+        # Splice the cached metrics JSON into the envelope instead of re-serializing it
+        body = (
+            _SUCCESS_PREFIX
+            + iso_now_bytes()
+            + b'","metrics":'
+            + performance_monitor.get_metrics_json()
+            + b'}'
+        )
+        return Response(content=body, media_type="application/json", headers=NEGOTIATED_HEADERS)
         
     except Exception as e:
         logger.error(f"Error getting metrics: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving metrics")
 
 
-@app.get("/stats", tags=["Monitoring"])
+@app.get("/stats", tags=["Monitoring"], response_class=ORJSONResponse)
 async def get_stats():
     """
     Get simplified statistics for monitoring dashboards.
@@ -447,12 +641,10 @@ async def get_stats():
             "system": metrics.get("system", {})
         }
         
+        body = _SUCCESS_PREFIX + iso_now_bytes() + b'","stats":' + orjson.dumps(stats) + b'}'
+        
         logger.info("Statistics requested")
-        return {
-            "status": "success",
-            "timestamp": datetime.now().isoformat(),
-            "stats": stats
-        }
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
@@ -538,7 +730,7 @@ async def delete_result(result_id: str):
         raise HTTPException(status_code=500, detail="Error deleting result")
 
 
-@app.get("/security/limits", tags=["Security"])
+@app.get("/security/limits", tags=["Security"], response_class=ORJSONResponse)
 async def get_rate_limits(request: Request):
     """
     Get current rate limit information for the requesting client.
@@ -560,13 +752,13 @@ async def get_rate_limits(request: Request):
         client_ip = request.client.host if request.client else "unknown"
         is_allowed, limits_info = rate_limiter.is_allowed(request)
         
-        return {
+        return ORJSONResponse(content={
             "status": "success",
             "client_ip": client_ip,
             "rate_limit_status": "allowed" if is_allowed else "exceeded",
             "limits": limits_info,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": iso_now()
+        })
         
     except Exception as e:
         logger.error(f"Error getting rate limits: {str(e)}")
@@ -578,28 +770,50 @@ async def get_rate_limits(request: Request):
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions with proper logging"""
     logger.error(f"HTTP {exc.status_code}: {exc.detail}")
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={
-            "status": "error",
-            "message": exc.detail,
-            "timestamp": datetime.now().isoformat()
-        }
-    )
+    return error_response(exc.status_code, orjson.dumps(exc.detail, default=str))
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions"""
     logger.error(f"Unhandled exception: {str(exc)}")
-    return JSONResponse(
-        status_code=500,
-        content={
-            "status": "error",
-            "message": "Internal server error",
-            "timestamp": datetime.now().isoformat()
-        }
-    )
+    return error_response(500, _INTERNAL_ERROR_MESSAGE)
+
+
+# API documentation
+# The schema and docs pages are static once all routes are registered, so render them once
+_OPENAPI_BYTES = orjson.dumps(app.openapi())
+_SWAGGER_BYTES = get_swagger_ui_html(
+    openapi_url="/openapi.json", title=f"{app.title} - Swagger UI"
+).body
+_REDOC_BYTES = get_redoc_html(
+    openapi_url="/openapi.json", title=f"{app.title} - ReDoc"
+).body
+
+
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_schema():
+    """Serve the pre-serialized OpenAPI schema"""
+    return Response(content=_OPENAPI_BYTES, media_type="application/json")
+
+
+@app.get("/docs", include_in_schema=False)
+async def swagger_ui():
+    """Serve the pre-rendered Swagger UI page"""
+    return HTMLResponse(content=_SWAGGER_BYTES)
+
+
+@app.get("/redoc", include_in_schema=False)
+async def redoc():
+    """Serve the pre-rendered ReDoc page"""
+    return HTMLResponse(content=_REDOC_BYTES)
+
+
+# Index every route template once and stash the id on the route object, so the
+# metrics hot path reads an attribute instead of looking up the path string
+_endpoint_ids = performance_monitor.register_endpoints(route.path for route in app.routes)
+for _route in app.routes:
+    _route.metrics_endpoint_id = _endpoint_ids[_route.path]
 
 
 if __name__ == "__main__":
@@ -607,6 +821,8 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        loop="uvloop",
+        http="httptools",
+        workers=SERVER_WORKERS,
         log_level="info"
     )
@@ -1,60 +1,171 @@
+import asyncio
+import itertools
+import sys
 import time
 import psutil
 import threading
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import deque
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+class RollingStats:
+    """Sum, min and max over a sliding window, maintained incrementally"""
+    
+    __slots__ = ("values", "total", "_mins", "_maxs", "_seq")
+    
+    def __init__(self, maxlen: int):
+        self.values = deque(maxlen=maxlen)
+        self.total = 0
+        # Monotonic queues of (sequence, value) whose fronts are the window min/max
+        self._mins = deque()
+        self._maxs = deque()
+        self._seq = 0
+    
+    def add(self, value):
+        """Add a value, evicting the oldest one once the window is full"""
+        values = self.values
+        if len(values) == values.maxlen:
+            self.total -= values[0]
+        values.append(value)
+        self.total += value
+        
+        seq = self._seq
+        self._seq = seq + 1
+        oldest = seq - len(values) + 1
+        
+        mins = self._mins
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((seq, value))
+        while mins[0][0] < oldest:
+            mins.popleft()
+        
+        maxs = self._maxs
+        while maxs and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((seq, value))
+        while maxs[0][0] < oldest:
+            maxs.popleft()
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else 0
+    
+    @property
+    def max(self):
+        return self._maxs[0][1] if self._maxs else 0
+    
+    @property
+    def avg(self) -> float:
+        return self.total / len(self.values) if self.values else 0
+
+# Endpoint name for requests that matched no route (404s, scanners)
+UNMATCHED_ENDPOINT = "<unmatched>"
+UNMATCHED_ENDPOINT_ID = 0
+
 class PerformanceMonitor:
     """Performance monitoring and metrics collection"""
     
-    def __init__(self, max_history: int = 1000):
+    def __init__(self, max_history: int = 1000, metrics_cache_ttl: float = 1.0):
         self.max_history = max_history
         self.start_time = datetime.now()
         
-        # Request metrics
+        # Request metrics; itertools.count increments atomically under the GIL
         self.request_count = 0
-        self.error_count = 0
-        self.success_count = 0
+        self._request_counter = itertools.count(1)
+        # Request counts per status class: success (< 400), 4xx, 5xx
+        self._status_counts = [0, 0, 0]
+        
+        # Response time tracking, in integer nanoseconds
+        self.response_times = RollingStats(max_history)
+        
+        # Endpoints are registered once and referred to by index on the hot path;
+        # per-endpoint stats live in lists indexed by that id. Id 0 is for
+        # requests that matched no route.
+        self.endpoint_names: List[str] = []
+        self.endpoint_ids: Dict[str, int] = {}
+        self.endpoint_times: List[RollingStats] = []
+        self._endpoint_counts: List[int] = []
+        self._endpoint_sum_ns: List[int] = []
+        self.endpoint_id(UNMATCHED_ENDPOINT)
         
-        # Response time tracking
-        self.response_times = deque(maxlen=max_history)
-        self.endpoint_times = defaultdict(lambda: deque(maxlen=max_history))
+        # Preallocated ring of (endpoint_id, ns) samples; record_request only stores
+        # into it and _drain_ring folds new samples into the rolling stats
+        self._ring = [(0, 0)] * max_history
+        self._ring_seq = itertools.count()
+        self._ring_written = 0
+        self._ring_drained = 0
         
         # File processing metrics
         self.files_processed = 0
+        self._files_counter = itertools.count(1)
         self.total_processing_time = 0.0
         self.avg_processing_time = 0.0
         
-        # System metrics
+        # System metrics; the latest sample is also kept on its own for cheap reads
         self.system_metrics = deque(maxlen=max_history)
+        self.latest_system_metrics: Dict[str, Any] = {}
         
-        # Thread safety
+        # Serialized metrics snapshot reused by frequent scrapes
+        self.metrics_cache_ttl = metrics_cache_ttl
+        self._metrics_json = b""
+        self._metrics_json_at = 0.0
+        
+        # Thread safety for snapshot readers; the record_* writers are lock-free
         self._lock = threading.Lock()
+    
+    async def run_system_monitoring(self, interval: float = 60):
+        """Collect system metrics periodically; meant to run as an asyncio background task"""
+        loop = asyncio.get_running_loop()
         
-        # Start system monitoring
-        self._start_system_monitoring()
+        # Prime cpu_percent so the non-blocking samples measure usage since the previous call
+        psutil.cpu_percent(interval=None)
+        await asyncio.sleep(1)
+        
+        while True:
+            try:
+                await loop.run_in_executor(None, self._collect_system_metrics)
+            except Exception as e:
+                logger.error(f"Error in system monitoring: {e}")
+            await asyncio.sleep(interval)  # Collect every minute
+    
+    async def run_metrics_aggregation(self, interval: float = 5):
+        """Fold recorded request samples into the rolling stats periodically; meant to run as an asyncio background task"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                with self._lock:
+                    self._drain_ring()
+            except Exception as e:
+                logger.error(f"Error aggregating request metrics: {e}")
     
-    def _start_system_monitoring(self):
-        """Start background system monitoring"""
-        def monitor_system():
-            while True:
-                try:
-                    self._collect_system_metrics()
-                    time.sleep(60)  # Collect every minute
-                except Exception as e:
-                    logger.error(f"Error in system monitoring: {e}")
+    def _drain_ring(self):
+        """Add samples recorded since the last drain to the rolling stats"""
+        written = self._ring_written
+        size = self.max_history
+        # Samples older than one full lap were overwritten before being drained
+        start = max(self._ring_drained, written - size)
         
-        monitor_thread = threading.Thread(target=monitor_system, daemon=True)
-        monitor_thread.start()
+        ring = self._ring
+        response_times = self.response_times
+        endpoint_times = self.endpoint_times
+        for seq in range(start, written):
+            endpoint_id, response_time_ns = ring[seq % size]
+            response_times.add(response_time_ns)
+            endpoint_times[endpoint_id].add(response_time_ns)
+        self._ring_drained = written
     
     def _collect_system_metrics(self):
         """Collect current system metrics"""
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
+            cpu_percent = psutil.cpu_percent(interval=None)
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
             
@@ -71,55 +182,80 @@ class PerformanceMonitor:
             
             with self._lock:
                 self.system_metrics.append(metrics)
+                self.latest_system_metrics = metrics
                 
         except Exception as e:
             logger.error(f"Error collecting system metrics: {e}")
     
-    def record_request(self, endpoint: str, method: str, status_code: int, response_time: float):
+    @property
+    def success_count(self) -> int:
+        return self._status_counts[0]
+    
+    @property
+    def error_count(self) -> int:
+        return self._status_counts[1] + self._status_counts[2]
+    
+    def endpoint_id(self, endpoint: str) -> int:
+        """Return the index of an endpoint, registering it on first use"""
+        endpoint_id = self.endpoint_ids.get(endpoint)
+        if endpoint_id is None:
+            endpoint = sys.intern(endpoint)
+            endpoint_id = self.endpoint_ids[endpoint] = len(self.endpoint_names)
+            self.endpoint_names.append(endpoint)
+            self.endpoint_times.append(RollingStats(self.max_history))
+            self._endpoint_counts.append(0)
+            self._endpoint_sum_ns.append(0)
+        return endpoint_id
+    
+    def register_endpoints(self, endpoints: Iterable[str]) -> Dict[str, int]:
+        """Register endpoint templates up front, in sorted order"""
+        for endpoint in sorted(set(endpoints)):
+            self.endpoint_id(endpoint)
+        return self.endpoint_ids
+    
+    def record_request(self, endpoint_id: int, method: str, status_code: int, response_time_ns: int):
         """Record a request and its metrics"""
-        with self._lock:
-            self.request_count += 1
-            
-            if 200 <= status_code < 400:
-                self.success_count += 1
-            else:
-                self.error_count += 1
-            
-            # Record response time
-            self.response_times.append(response_time)
-            self.endpoint_times[endpoint].append(response_time)
+        self.request_count = next(self._request_counter)
+        self._status_counts[0 if status_code < 400 else 1 if status_code < 500 else 2] += 1
+        self._endpoint_counts[endpoint_id] += 1
+        self._endpoint_sum_ns[endpoint_id] += response_time_ns
+        
+        # Record response time; a single list store, aggregated later by _drain_ring
+        seq = next(self._ring_seq)
+        self._ring[seq % self.max_history] = (endpoint_id, response_time_ns)
+        self._ring_written = seq + 1
     
     def record_file_processing(self, processing_time: float):
         """Record file processing metrics"""
-        with self._lock:
-            self.files_processed += 1
-            self.total_processing_time += processing_time
-            self.avg_processing_time = self.total_processing_time / self.files_processed
+        # Called from the event loop thread only, so the running total needs no lock
+        files_processed = next(self._files_counter)
+        self.total_processing_time += processing_time
+        self.avg_processing_time = self.total_processing_time / files_processed
+        self.files_processed = files_processed
     
     def get_metrics(self) -> Dict[str, Any]:
         """Get comprehensive metrics"""
         with self._lock:
-            # Calculate response time statistics
-            response_times_list = list(self.response_times)
-            avg_response_time = sum(response_times_list) / len(response_times_list) if response_times_list else 0
-            min_response_time = min(response_times_list) if response_times_list else 0
-            max_response_time = max(response_times_list) if response_times_list else 0
+            self._drain_ring()
+            
+            # Response time statistics from running aggregates (nanoseconds to seconds)
+            response_times = self.response_times
             
             # Calculate endpoint statistics
             endpoint_stats = {}
-            for endpoint, times in self.endpoint_times.items():
-                times_list = list(times)
-                if times_list:
-                    endpoint_stats[endpoint] = {
-                        "count": len(times_list),
-                        "avg_time": sum(times_list) / len(times_list),
-                        "min_time": min(times_list),
-                        "max_time": max(times_list)
+            endpoint_counts = self._endpoint_counts
+            endpoint_sum_ns = self._endpoint_sum_ns
+            for endpoint_id, times in enumerate(self.endpoint_times):
+                if times:
+                    endpoint_stats[self.endpoint_names[endpoint_id]] = {
+                        "count": len(times),
+                        "total_count": endpoint_counts[endpoint_id],
+                        "lifetime_avg_time": endpoint_sum_ns[endpoint_id] / endpoint_counts[endpoint_id] / 1e9,
+                        "avg_time": times.avg / 1e9,
+                        "min_time": times.min / 1e9,
+                        "max_time": times.max / 1e9
                     }
             
-            # Get latest system metrics
-            latest_system = self.system_metrics[-1] if self.system_metrics else {}
-            
             return {
                 "uptime_seconds": (datetime.now() - self.start_time).total_seconds(),
                 "start_time": self.start_time.isoformat(),
@@ -127,13 +263,15 @@ class PerformanceMonitor:
                     "total": self.request_count,
                     "success": self.success_count,
                     "errors": self.error_count,
+                    "client_errors": self._status_counts[1],
+                    "server_errors": self._status_counts[2],
                     "success_rate": (self.success_count / self.request_count * 100) if self.request_count > 0 else 0
                 },
                 "response_times": {
-                    "avg": avg_response_time,
-                    "min": min_response_time,
-                    "max": max_response_time,
-                    "recent_count": len(response_times_list)
+                    "avg": response_times.avg / 1e9,
+                    "min": response_times.min / 1e9,
+                    "max": response_times.max / 1e9,
+                    "recent_count": len(response_times)
                 },
                 "endpoints": endpoint_stats,
                 "file_processing": {
@@ -141,24 +279,52 @@ class PerformanceMonitor:
                     "total_processing_time": self.total_processing_time,
                     "avg_processing_time": self.avg_processing_time
                 },
-                "system": latest_system
+                "system": self.latest_system_metrics
             }
     
+    def get_metrics_json(self) -> bytes:
+        """Get metrics serialized as JSON, reusing a snapshot younger than metrics_cache_ttl"""
+        now = time.monotonic()
+        if not self._metrics_json or now - self._metrics_json_at >= self.metrics_cache_ttl:
+            self._metrics_json = orjson.dumps(self.get_metrics())
+            self._metrics_json_at = now
+        return self._metrics_json
+    
+    def get_lite_snapshot(self) -> Dict[str, Any]:
+        """Get the headline metrics from running aggregates, without endpoint breakdowns"""
+        with self._lock:
+            self._drain_ring()
+        
+        request_count = self.request_count
+        system = self.latest_system_metrics
+        
+        return {
+            "uptime_seconds": (datetime.now() - self.start_time).total_seconds(),
+            "requests_total": request_count,
+            "success_rate": (self.success_count / request_count * 100) if request_count > 0 else 0,
+            # Only 5xx responses count: rejected client input is not a service fault
+            "error_rate": (self._status_counts[2] / request_count * 100) if request_count > 0 else 0,
+            "avg_response_time": self.response_times.avg / 1e9,
+            "files_processed": self.files_processed,
+            "cpu_percent": system.get("cpu_percent", 0),
+            "memory_percent": system.get("memory_percent", 0),
+            "disk_percent": system.get("disk_percent", 0)
+        }
+    
     def get_health_status(self) -> Dict[str, Any]:
         """Get system health status"""
-        metrics = self.get_metrics()
+        metrics = self.get_lite_snapshot()
         
         # Define health thresholds
         cpu_threshold = 80  # 80% CPU usage
         memory_threshold = 85  # 85% memory usage
         disk_threshold = 90  # 90% disk usage
-        error_rate_threshold = 10  # 10% error rate
+        error_rate_threshold = 10  # 10% server error rate
         
-        system = metrics.get("system", {})
-        cpu_percent = system.get("cpu_percent", 0)
-        memory_percent = system.get("memory_percent", 0)
-        disk_percent = system.get("disk_percent", 0)
-        error_rate = metrics["requests"]["success_rate"]
+        cpu_percent = metrics["cpu_percent"]
+        memory_percent = metrics["memory_percent"]
+        disk_percent = metrics["disk_percent"]
+        error_rate = metrics["error_rate"]
         
         # Determine overall health
         health_issues = []
@@ -172,8 +338,8 @@ class PerformanceMonitor:
         if disk_percent > disk_threshold:
             health_issues.append(f"High disk usage: {disk_percent}%")
         
-        if error_rate < (100 - error_rate_threshold):
-            health_issues.append(f"High error rate: {100 - error_rate}%")
+        if error_rate > error_rate_threshold:
+            health_issues.append(f"High server error rate: {error_rate:.2f}%")
         
         overall_status = "healthy" if not health_issues else "degraded"
         
@@ -1,9 +1,10 @@
 import cv2
+import itertools
 import numpy as np
+import struct
 import time
-from typing import Dict, Tuple, Optional
-from imutils.perspective import four_point_transform
-from imutils import contours
+from typing import Dict, Tuple, Optional, Union
+from imutils.perspective import order_points
 from PIL import Image
 import io
 
@@ -15,6 +16,55 @@ except ImportError:
     import mimetypes
     MAGIC_AVAILABLE = False
 
+# Try to import numba for the compiled bubble filter, fallback to NumPy if not available
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Structuring elements for the bubble morphology, built once at import
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
+EROSION_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (1, 1))
+
+# Marks are measured on a black-hat image (paper level minus pixel), where a
+# mark pixel reads its full contrast to the paper. The closing that estimates
+# the paper spans INK_KERNEL_BUBBLES bubble widths, wide enough to close over
+# a whole mark however many neighbouring bubbles are marked. A pixel counts as
+# ink past INK_CONTRAST_FRACTION of the paper to darkest mark contrast, the
+# midpoint between the two, so faint pencil (gray ~150-200 on white paper)
+# reads as well as dark ink; the threshold never drops below INK_OFFSET_MIN,
+# which keeps paper texture and JPEG noise out on sheets with no marks.
+INK_KERNEL_BUBBLES = 2
+INK_CONTRAST_FRACTION = 0.5
+INK_OFFSET_MIN = 20
+
+# The fallback bubble search keeps candidates within this fraction of the
+# median width, dropping specks and merged blobs
+FALLBACK_WIDTH_TOLERANCE = 0.5
+
+# Share of the expected bubbles that must be found; faint empty outlines the
+# binarization misses are tolerated, since marks are placed on the grid by
+# position rather than by counting bubbles
+MIN_FOUND_BUBBLE_FRACTION = 0.75
+
+# Smallest quadrilateral, as a fraction of the image area, taken as the sheet
+# outline; smaller ones are printed boxes or logos on a scanned sheet
+MIN_SHEET_AREA_FRACTION = 0.25
+
+# CLAHE instance reused across sheets; created lazily so importing the module
+# (e.g. in the API process) does not build it. Sheets run one at a time in
+# each single-threaded ProcessPoolExecutor worker, so one instance per process
+_clahe: Optional[cv2.CLAHE] = None
+
+
+def get_clahe() -> cv2.CLAHE:
+    """Return this process's CLAHE instance, creating it on first use"""
+    global _clahe
+    if _clahe is None:
+        _clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    return _clahe
+
 
 class OMRProcessingError(Exception):
     """Custom exception for OMR processing errors"""
@@ -26,12 +76,12 @@ class FileValidationError(Exception):
     pass
 
 
-def validate_image_file(file_bytes: bytes, max_size_mb: int = 10) -> Tuple[bool, str]:
+def validate_image_file(file_bytes: Union[bytes, bytearray], max_size_mb: int = 10) -> Tuple[bool, str]:
     """
     Validate uploaded image file for format and size.
     
     Args:
-        file_bytes: The uploaded file bytes
+        file_bytes: The uploaded file bytes (bytes or bytearray)
         max_size_mb: Maximum file size in MB
         
     Returns:
@@ -42,24 +92,40 @@ def validate_image_file(file_bytes: bytes, max_size_mb: int = 10) -> Tuple[bool,
     if file_size_mb > max_size_mb:
         return False, f"File size ({file_size_mb:.2f}MB) exceeds maximum allowed size ({max_size_mb}MB)"
     
+    # Recognized signatures with a readable header and a complete body skip
+    # libmagic and PIL; the header dimensions stand in for PIL's decompression
+    # bomb guard, so a small file cannot declare an image too large to decode
+    image_format = _detect_image_format(file_bytes)
+    if image_format is not None:
+        dimensions = _sniff_dimensions(file_bytes, image_format)
+        if dimensions is not None:
+            width, height = dimensions
+            if width * height > Image.MAX_IMAGE_PIXELS:
+                return False, f"Image size ({width}x{height}) exceeds limit of {Image.MAX_IMAGE_PIXELS} pixels"
+            if _has_image_end(file_bytes, image_format):
+                return True, ""
+    
     # Check file format using python-magic or fallback
-    if MAGIC_AVAILABLE:
-        try:
-            file_type = magic.from_buffer(file_bytes, mime=True)
-            allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp']
-            
-            if file_type not in allowed_types:
-                return False, f"Unsupported file type: {file_type}. Allowed types: {', '.join(allowed_types)}"
-        except Exception as e:
-            return False, f"Error detecting file type: {str(e)}"
-    else:
-        # Fallback validation using file signatures
-        if not _validate_file_signature(file_bytes):
+    if image_format is None:
+        if MAGIC_AVAILABLE:
+            try:
+                # libmagic only needs the header, and python-magic requires bytes
+                file_type = magic.from_buffer(bytes(memoryview(file_bytes)[:2048]), mime=True)
+                allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp']
+                
+                if file_type not in allowed_types:
+                    return False, f"Unsupported file type: {file_type}. Allowed types: {', '.join(allowed_types)}"
+            except Exception as e:
+                return False, f"Error detecting file type: {str(e)}"
+        else:
             return False, "Unsupported file type. Allowed types: JPG, PNG, BMP"
     
     # Additional validation using PIL
     try:
         image = Image.open(io.BytesIO(file_bytes))
+        width, height = image.size
+        if width * height > Image.MAX_IMAGE_PIXELS:
+            return False, f"Image size ({width}x{height}) exceeds limit of {Image.MAX_IMAGE_PIXELS} pixels"
         image.verify()
     except Exception as e:
         return False, f"Invalid image file: {str(e)}"
@@ -67,97 +133,324 @@ def validate_image_file(file_bytes: bytes, max_size_mb: int = 10) -> Tuple[bool,
     return True, ""
 
 
-def _validate_file_signature(file_bytes: bytes) -> bool:
-    """Validate file type using file signatures (magic numbers)"""
+# File signatures (magic numbers) of the accepted formats
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'BM', 'BMP')
+)
+
+# Trailers marking a complete file: the PNG IEND chunk and the JPEG EOI marker
+PNG_END = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+JPEG_END = b'\xff\xd9'
+
+
+def _detect_image_format(file_bytes: Union[bytes, bytearray]) -> Optional[str]:
+    """Return the image format named by the file signature, if recognized"""
     if len(file_bytes) < 4:
-        return False
-    
-    # Check file signatures (magic numbers)
-    signatures = {
-        b'\xff\xd8\xff': 'JPEG',
-        b'\x89PNG\r\n\x1a\n': 'PNG',
-        b'BM': 'BMP'
-    }
+        return None
     
-    for signature, format_name in signatures.items():
+    for signature, format_name in IMAGE_SIGNATURES:
         if file_bytes.startswith(signature):
-            return True
+            return format_name
     
-    return False
+    return None
+
+
+def _jpeg_dimensions(file_bytes: Union[bytes, bytearray]) -> Optional[Tuple[int, int]]:
+    """Read width and height from the first JPEG start-of-frame segment"""
+    i = 2
+    while i + 9 <= len(file_bytes):
+        if file_bytes[i] != 0xFF:
+            return None
+        marker = file_bytes[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Standalone markers carry no length
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from(">HH", file_bytes, i + 5)
+            return width, height
+        i += 2 + struct.unpack_from(">H", file_bytes, i + 2)[0]
+    return None
 
 
-def detect_bubbles_with_threshold(thresh_image, min_size: int, max_size: int = None, aspect_ratio_range: tuple = (0.5, 1.5), debug_mode: bool = False):
+def _sniff_dimensions(file_bytes: Union[bytes, bytearray], image_format: str) -> Optional[Tuple[int, int]]:
     """
-    Detect bubbles using specific size and aspect ratio thresholds
+    Read image dimensions straight from the file header
+    
+    Returns:
+        Tuple of (width, height), or None if the header is truncated or malformed
+    """
+    try:
+        if image_format == 'PNG':
+            if file_bytes[12:16] != b'IHDR':
+                return None
+            width, height = struct.unpack_from(">II", file_bytes, 16)
+        elif image_format == 'JPEG':
+            dimensions = _jpeg_dimensions(file_bytes)
+            if dimensions is None:
+                return None
+            width, height = dimensions
+        else:
+            width, height = struct.unpack_from("<ii", file_bytes, 18)
+            height = abs(height)  # Negative height marks a top-down BMP
+    except struct.error:
+        return None
+    
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+
+def _has_image_end(file_bytes: Union[bytes, bytearray], image_format: str) -> bool:
+    """
+    Check that the file is not truncated, from the end marker or declared size of its format
+    
+    PNG must end with the IEND chunk and JPEG carry an end-of-image marker in its
+    last kilobyte (encoders may pad after it); a BMP must be at least as long as
+    the file size in its header.
+    """
+    if image_format == 'PNG':
+        return file_bytes.endswith(PNG_END)
+    if image_format == 'JPEG':
+        return file_bytes.rfind(JPEG_END, max(2, len(file_bytes) - 1024)) != -1
+    return struct.unpack_from("<I", file_bytes, 2)[0] <= len(file_bytes)
+
+
+def find_external_contours(image):
+    """
+    Find the external contours of a binary image
+    
+    findContours leaves its input untouched since OpenCV 3.2, so no defensive
+    copy is made. OpenCV 3 returns (image, contours, hierarchy) and OpenCV 4
+    (contours, hierarchy); the contours are second to last in both.
+    """
+    return cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+
+def contour_stats(thresh_image, debug_mode: bool = False) -> tuple:
+    """
+    Find the external contours of a binary image and their bounding box stats
     
     Args:
         thresh_image: Binary thresholded image
-        min_size: Minimum bubble size (width/height)
-        max_size: Maximum bubble size (if None, no upper limit)
-        aspect_ratio_range: Tuple of (min_ar, max_ar) for aspect ratio filtering
         debug_mode: Enable debug output
     
     Returns:
-        List of bubble contours
+        Tuple of (contours, rects, widths, heights, aspect_ratios), the last four as
+        NumPy arrays with one (x, y, w, h) row / value per contour
     """
-    cnts, _ = cv2.findContours(thresh_image.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = find_external_contours(thresh_image)
     
     if debug_mode:
         print(f"    Found {len(cnts)} total contours")
     
-    bubble_contours = []
-    for c in cnts:
-        (x, y, w, h) = cv2.boundingRect(c)
-        ar = w / float(h)
-        
-        # Size filtering
-        size_ok = w >= min_size and h >= min_size
-        if max_size:
-            size_ok = size_ok and w <= max_size and h <= max_size
-        
-        # Aspect ratio filtering
-        ar_ok = aspect_ratio_range[0] <= ar <= aspect_ratio_range[1]
-        
-        if size_ok and ar_ok:
-            bubble_contours.append(c)
+    rects = np.array([cv2.boundingRect(c) for c in cnts], dtype=np.int32).reshape(-1, 4)
+    widths = rects[:, 2]
+    heights = rects[:, 3]
+    aspect_ratios = widths / np.maximum(heights, 1)
     
-    if debug_mode and len(bubble_contours) == 0 and len(cnts) > 0:
-        # Show some sample contours that were rejected
-        sample_cnts = cnts[:5]  # Show first 5 contours
-        print(f"    Sample rejected contours (showing first 5):")
-        for i, c in enumerate(sample_cnts):
-            (x, y, w, h) = cv2.boundingRect(c)
-            ar = w / float(h)
-            print(f"      Contour {i}: size={w}x{h}, AR={ar:.2f}, min_size={min_size}, max_size={max_size}, AR_range={aspect_ratio_range}")
+    return cnts, rects, widths, heights, aspect_ratios
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, boundscheck=False)
+    def _filter_sizes(widths, heights, min_size, max_size, min_ar, max_ar):
+        """Compiled single-pass size and aspect ratio filter; max_size 0 means no upper limit"""
+        out = np.empty(widths.shape[0], np.bool_)
+        for i in range(widths.shape[0]):
+            w = widths[i]
+            h = heights[i]
+            ar = w / h if h else 0.0
+            ok = w >= min_size and h >= min_size and min_ar <= ar <= max_ar
+            if max_size:
+                ok = ok and w <= max_size and h <= max_size
+            out[i] = ok
+        return out
+
+
+def bubble_mask(stats: tuple, min_size: int, max_size: int = None, aspect_ratio_range: tuple = (0.5, 1.5)):
+    """
+    Boolean mask of the contours passing the size and aspect ratio filters
     
-    return bubble_contours
+    Args:
+        stats: Contour stats from contour_stats()
+        min_size: Minimum bubble size (width/height)
+        max_size: Maximum bubble size (if None, no upper limit)
+        aspect_ratio_range: Tuple of (min_ar, max_ar) for aspect ratio filtering
+    
+    Returns:
+        NumPy boolean array with one entry per contour
+    """
+    _, _, widths, heights, aspect_ratios = stats
+    
+    if NUMBA_AVAILABLE:
+        return _filter_sizes(widths, heights, min_size, max_size or 0, float(aspect_ratio_range[0]), float(aspect_ratio_range[1]))
+    
+    # Size filtering
+    mask = (widths >= min_size) & (heights >= min_size)
+    if max_size:
+        mask &= (widths <= max_size) & (heights <= max_size)
+    
+    # Aspect ratio filtering
+    mask &= (aspect_ratios >= aspect_ratio_range[0]) & (aspect_ratios <= aspect_ratio_range[1])
+    
+    return mask
 
 
-def calculate_proximity_score(found_count: int, expected_count: int) -> float:
+def proximity_scores(found_counts: np.ndarray, expected_count: int) -> np.ndarray:
     """
-    Calculate how close the found bubble count is to expected count
+    Score how close each found bubble count is to the expected count
     
     Args:
-        found_count: Number of bubbles found
+        found_counts: Array of bubble counts
         expected_count: Expected number of bubbles
     
     Returns:
-        Score between 0 and 1 (1 = perfect match)
+        Array of scores between 0 and 1 (1 = perfect match)
     """
     if expected_count == 0:
-        return 0.0
+        return np.zeros(found_counts.shape)
     
-    # Calculate percentage difference
-    percentage_diff = abs(found_count - expected_count) / expected_count
+    # Score from percentage difference, plus a bonus for being close to expected count
+    ratio = found_counts / expected_count
+    scores = np.maximum(0, 1 - np.abs(found_counts - expected_count) / expected_count)
+    scores += 0.1 * ((ratio >= 0.8) & (ratio <= 1.2))
     
-    # Convert to score (0 = no match, 1 = perfect match)
-    score = max(0, 1 - percentage_diff)
+    return np.minimum(1.0, scores)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, boundscheck=False)
+    def _score_rows(areas, num_options, min_pixel_threshold):
+        """Compiled response scorer over flattened per-option pixel counts"""
+        num_rows = areas.shape[0] // num_options
+        marked = np.empty(num_rows, np.int64)
+        confidences = np.empty(num_rows, np.float64)
+        answered = np.empty(num_rows, np.bool_)
+        for q in range(num_rows):
+            base = q * num_options
+            # Track the first maximum and the runner-up in one pass
+            best = areas[base]
+            second = -1
+            marked_index = 0
+            for o in range(1, num_options):
+                value = areas[base + o]
+                if value > best:
+                    second = best
+                    best = value
+                    marked_index = o
+                elif value > second:
+                    second = value
+            marked[q] = marked_index
+            if num_options == 1:
+                confidences[q] = 1.0
+            elif best > 0:
+                confidences[q] = (best - second) / best
+            else:
+                confidences[q] = 0.0
+            answered[q] = best > min_pixel_threshold
+        return marked, confidences, answered
+
+
+def score_responses(areas: np.ndarray, min_pixel_threshold: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pick the marked option of every question from its per-option pixel counts
     
-    # Bonus for being close to expected count
-    if 0.8 <= found_count / expected_count <= 1.2:
-        score += 0.1
+    Args:
+        areas: Marked pixel counts, one row per question, options left to right
+        min_pixel_threshold: The minimum number of pixels to count a bubble as "marked"
     
-    return min(1.0, score)
+    Returns:
+        Tuple of (marked option indices, confidences, answered mask)
+    """
+    num_rows, num_options = areas.shape
+    if NUMBA_AVAILABLE:
+        return _score_rows(np.ascontiguousarray(areas, dtype=np.int64).ravel(), num_options, min_pixel_threshold)
+    
+    # The marked option is the first one with the most marked pixels
+    marked = areas.argmax(axis=1)
+    best = areas.max(axis=1)
+    
+    # Calculate confidence scores from the gap between the two highest counts
+    if num_options > 1:
+        second = np.partition(areas, -2, axis=1)[:, -2]
+        confidences = np.where(best > 0, (best - second) / np.maximum(best, 1), 0.0)
+    else:
+        confidences = np.ones(num_rows)
+    
+    return marked, confidences, best > min_pixel_threshold
+
+
+def ink_offset(enhanced: np.ndarray, labels: np.ndarray, num_labels: int, interior: np.ndarray) -> float:
+    """
+    Black-hat level above which a pixel counts as marking ink
+    
+    Taken as a fraction of the contrast between the paper and the darkest bubble
+    interior (the most clearly filled mark), so pencil marks fainter than the
+    printed outlines are still counted
+    
+    Args:
+        enhanced: Contrast enhanced grayscale sheet
+        labels: Bubble label image, 0 for the background
+        num_labels: Number of labels including the background
+        interior: Mask of the bubble interiors with the outlines eroded away
+    
+    Returns:
+        Threshold for the black-hat image
+    """
+    inside = interior > 0
+    if not inside.any():
+        # Bubbles too small to survive the erosion are measured whole
+        inside = labels > 0
+    bubble_labels = labels[inside]
+    pixel_counts = np.bincount(bubble_labels, minlength=num_labels)[1:]
+    intensity_sums = np.bincount(bubble_labels, weights=enhanced[inside], minlength=num_labels)[1:]
+    measured = pixel_counts > 0
+    
+    # Paper covers most of the sheet, so its median is the paper level
+    mark_level = (intensity_sums[measured] / pixel_counts[measured]).min()
+    contrast = float(np.median(enhanced)) - mark_level
+    return max(INK_OFFSET_MIN, INK_CONTRAST_FRACTION * contrast)
+
+
+def grid_cells(centroids: np.ndarray, bubble_height: int, num_options: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assign bubbles to question rows and option columns from their centroids
+    
+    Rows break where the next centroid down is more than half a bubble lower;
+    the option columns are split at the num_options - 1 widest horizontal gaps.
+    
+    Args:
+        centroids: Array of (x, y) bubble centroids
+        bubble_height: Typical bubble height in pixels
+        num_options: Number of options per question
+    
+    Returns:
+        Tuple of (rows, cols) index arrays, one entry per bubble
+    """
+    y_order = np.argsort(centroids[:, 1], kind="stable")
+    rows = np.empty(len(centroids), dtype=np.intp)
+    rows[y_order] = np.concatenate(([0], np.cumsum(np.diff(centroids[y_order, 1]) > bubble_height / 2)))
+    
+    x_order = np.argsort(centroids[:, 0], kind="stable")
+    splits = np.sort(np.argsort(np.diff(centroids[x_order, 0]))[len(centroids) - num_options:])
+    cols = np.empty(len(centroids), dtype=np.intp)
+    cols[x_order] = np.searchsorted(splits, np.arange(len(centroids)), side="left")
+    
+    return rows, cols
+
+
+def _nearest(sorted_values: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Index of the closest entry of an ascending array, for each value"""
+    right = np.searchsorted(sorted_values, values).clip(0, len(sorted_values) - 1)
+    left = (right - 1).clip(0)
+    return np.where(np.abs(values - sorted_values[left]) < np.abs(values - sorted_values[right]), left, right)
 
 
 def multi_scale_bubble_detection(thresh_image, expected_count: int, debug_mode: bool = False) -> dict:
@@ -172,9 +465,6 @@ def multi_scale_bubble_detection(thresh_image, expected_count: int, debug_mode:
     Returns:
         Dictionary with optimal detection parameters and results
     """
-    best_result = None
-    best_score = 0
-    
     if debug_mode:
         print(f"Multi-scale detection: Testing for {expected_count} expected bubbles")
         print(f"Input image shape: {thresh_image.shape}")
@@ -202,40 +492,48 @@ def multi_scale_bubble_detection(thresh_image, expected_count: int, debug_mode:
     if debug_mode:
         print(f"Multi-scale detection: Expected {expected_count} bubbles")
     
-    for min_size, max_size in size_ranges:
-        for min_ar, max_ar in aspect_ratio_ranges:
-            # Detect bubbles with current parameters
-            bubbles = detect_bubbles_with_threshold(
-                thresh_image, 
-                min_size, 
-                max_size, 
-                (min_ar, max_ar),
-                debug_mode
-            )
-            
-            # Calculate score
-            score = calculate_proximity_score(len(bubbles), expected_count)
-            
-            if debug_mode:
-                print(f"  Size: {min_size}-{max_size}, AR: {min_ar}-{max_ar}, "
-                      f"Found: {len(bubbles)}, Score: {score:.3f}")
-            
-            # Update best result
-            if score > best_score:
-                best_score = score
-                best_result = {
-                    'bubbles': bubbles,
-                    'count': len(bubbles),
-                    'score': score,
-                    'min_size': min_size,
-                    'max_size': max_size,
-                    'aspect_ratio_range': (min_ar, max_ar)
-                }
+    # Find contours and their bounding boxes once, then evaluate every
+    # size x aspect ratio combination at once
+    stats = contour_stats(thresh_image, debug_mode)
+    _, _, widths, heights, aspect_ratios = stats
+    
+    sizes = np.array(size_ranges)
+    ratios = np.array(aspect_ratio_ranges)
+    min_sizes, max_sizes = sizes[:, 0, None], sizes[:, 1, None]
+    size_ok = (widths >= min_sizes) & (heights >= min_sizes) & (widths <= max_sizes) & (heights <= max_sizes)
+    ar_ok = (aspect_ratios >= ratios[:, 0, None]) & (aspect_ratios <= ratios[:, 1, None])
+    # counts[i, j] = number of contours passing size range i and ratio range j; as a
+    # matrix product all combinations are counted in one BLAS call, without
+    # materializing a (sizes, ratios, contours) mask
+    counts = np.rint(size_ok.astype(np.float32) @ ar_ok.T.astype(np.float32)).astype(np.int64)
+    
+    # Calculate all scores
+    scores = proximity_scores(counts, expected_count)
+    
+    if debug_mode:
+        for (i, (min_size, max_size)), (j, (min_ar, max_ar)) in itertools.product(enumerate(size_ranges), enumerate(aspect_ratio_ranges)):
+            print(f"  Size: {min_size}-{max_size}, AR: {min_ar}-{max_ar}, "
+                  f"Found: {counts[i, j]}, Score: {scores[i, j]:.3f}")
+    
+    # The first combination with the highest non-zero score wins
+    best_result = None
+    i, j = np.unravel_index(scores.argmax(), scores.shape)
+    if scores[i, j] > 0:
+        min_size, max_size = size_ranges[i]
+        best_result = {
+            'count': int(counts[i, j]),
+            'score': float(scores[i, j]),
+            'min_size': min_size,
+            'max_size': max_size,
+            'aspect_ratio_range': aspect_ratio_ranges[j]
+        }
+        # Only select the contours of the winning combination
+        best_result['bubble_indices'] = np.flatnonzero(bubble_mask(stats, min_size, max_size, aspect_ratio_ranges[j]))
     
     if best_result is None:
         # If no bubbles found, return a default result
         best_result = {
-            'bubbles': [],
+            'bubble_indices': np.empty(0, dtype=np.intp),
             'count': 0,
             'score': 0.0,
             'min_size': 10,
@@ -250,11 +548,12 @@ def multi_scale_bubble_detection(thresh_image, expected_count: int, debug_mode:
             print(f"Parameters: size={best_result['min_size']}-{best_result['max_size']}, "
                   f"AR={best_result['aspect_ratio_range']}")
     
+    best_result['contour_stats'] = stats
     return best_result
 
 
 def process_omr_sheet(
-    image_bytes: bytes, 
+    image_bytes: Union[bytes, bytearray], 
     num_questions: int, 
     num_options: int, 
     min_pixel_threshold: int = 500,
@@ -292,17 +591,28 @@ def process_omr_sheet(
     height, width = image.shape[:2]
     
     # 1. Pre-processing for sheet detection
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # The outline is found on a copy at most ~1000px on its long side; blur,
+    # Canny and findContours scale with pixel count, and the outline corners
+    # are mapped back to full resolution for the perspective transform
+    detection_scale = min(1.0, 1000 / max(height, width))
+    if detection_scale < 1.0:
+        small = cv2.resize(image, None, fx=detection_scale, fy=detection_scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = image
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
     edged = cv2.Canny(blurred, 75, 200)
     
     # 2. Find and Isolate the Sheet
-    cnts, _ = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = find_external_contours(edged)
     doc_cnt = None
     
     if len(cnts) > 0:
         cnts = sorted(cnts, key=cv2.contourArea, reverse=True)
+        min_sheet_area = MIN_SHEET_AREA_FRACTION * gray.size
         for c in cnts:
+            if cv2.contourArea(c) < min_sheet_area:
+                break
             peri = cv2.arcLength(c, True)
             approx = cv2.approxPolyDP(c, 0.02 * peri, True)
             if len(approx) == 4:
@@ -310,26 +620,43 @@ def process_omr_sheet(
                 break
     
     if doc_cnt is None:
-        raise OMRProcessingError("Could not find the OMR sheet outline in the image")
+        # A scan (or a photo cropped to the sheet) has no background around
+        # the paper to outline; the whole frame is the sheet
+        small_height, small_width = gray.shape
+        doc_cnt = np.array([[0, 0], [small_width - 1, 0], [small_width - 1, small_height - 1], [0, small_height - 1]], dtype=np.float32)
+        if debug_mode:
+            print("No sheet outline found, using the whole image")
     
-    # Apply perspective transform but preserve reasonable size
-    paper = four_point_transform(image, doc_cnt.reshape(4, 2))
+    # Apply perspective transform on the full-resolution image but preserve reasonable size
+    rect = order_points(doc_cnt.reshape(4, 2) / detection_scale)
+    tl, tr, br, bl = rect
+    paper_width = max(int(np.linalg.norm(br - bl)), int(np.linalg.norm(tr - tl)))
+    paper_height = max(int(np.linalg.norm(tr - br)), int(np.linalg.norm(tl - bl)))
     
     # Resize to a larger size for better bubble detection
     # For dense OMR sheets, we need higher resolution
-    target_width = max(1200, paper.shape[1])
-    target_height = max(1200, paper.shape[0])
+    target_width = max(1200, paper_width)
+    target_height = max(1200, paper_height)
     
-    scale_x = target_width / paper.shape[1]
-    scale_y = target_height / paper.shape[0]
+    scale_x = target_width / paper_width
+    scale_y = target_height / paper_height
     scale = min(scale_x, scale_y)
     
-    new_width = int(paper.shape[1] * scale)
-    new_height = int(paper.shape[0] * scale)
-    paper = cv2.resize(paper, (new_width, new_height))
+    new_width = int(paper_width * scale)
+    new_height = int(paper_height * scale)
+    
+    # The resize is folded into the destination corners, so a single
+    # warpPerspective produces the final image in one interpolation pass
+    dst = np.array([
+        [0, 0],
+        [new_width - 1, 0],
+        [new_width - 1, new_height - 1],
+        [0, new_height - 1]], dtype=np.float32)
+    M = cv2.getPerspectiveTransform(rect, dst)
+    paper = cv2.warpPerspective(image, M, (new_width, new_height))
     
     if debug_mode:
-        print(f"Resized paper from {paper.shape} to {new_width}x{new_height} (scale: {scale:.2f})")
+        print(f"Resized paper from {paper_width}x{paper_height} to {new_width}x{new_height} (scale: {scale:.2f})")
     
     warped = cv2.cvtColor(paper, cv2.COLOR_BGR2GRAY)
     
@@ -338,8 +665,7 @@ def process_omr_sheet(
         print("Preprocessing for bubble detection...")
     
     # Apply adaptive histogram equalization to improve contrast
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(warped)
+    enhanced = get_clahe().apply(warped)
     
     # Apply slight blur to reduce noise while preserving bubble edges
     enhanced = cv2.GaussianBlur(enhanced, (3, 3), 0)
@@ -348,55 +674,41 @@ def process_omr_sheet(
         print(f"Enhanced image shape: {enhanced.shape}")
     
     # 4. Binarize and Identify Bubbles
-    # Try different thresholding approaches
-    thresh_inv = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
-    thresh_normal = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
-    
-    if debug_mode:
-        print(f"Normal threshold - white pixels: {np.sum(thresh_normal == 255)}")
-        print(f"Inverted threshold - white pixels: {np.sum(thresh_inv == 255)}")
-    
-    # Use the one with more white pixels (likely to have more bubble content)
-    if np.sum(thresh_normal == 255) > np.sum(thresh_inv == 255):
-        thresh = thresh_normal
-        if debug_mode:
-            print("Using normal threshold (bubbles are white)")
-    else:
-        thresh = thresh_inv
-        if debug_mode:
-            print("Using inverted threshold (bubbles are black)")
+    # Pixels darker than their local mean become white, so printed bubble
+    # outlines and pencil marks come out white regardless of uneven lighting;
+    # a single box-filter pass, with no global polarity choice to make
+    thresh = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 21, 5)
     
     # Apply morphological operations to separate connected bubbles
     if debug_mode:
         print("Applying morphological operations to separate bubbles...")
     
-    # Create a smaller kernel for more precise operations
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
-    
-    # Apply opening operation to separate connected bubbles (more gently)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+    # Apply opening operation to separate connected bubbles (more gently),
+    # using the small module-level kernel for more precise operations
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, MORPH_KERNEL)
     
     # Apply closing operation to fill small holes in bubbles
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, MORPH_KERNEL)
     
     # Try additional erosion to better separate bubbles
     if debug_mode:
         print("Applying additional erosion to better separate bubbles...")
     
     # Use a very small kernel for erosion
-    erosion_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (1, 1))
-    thresh = cv2.erode(thresh, erosion_kernel, iterations=1)
+    thresh = cv2.erode(thresh, EROSION_KERNEL, iterations=1)
     
     if debug_mode:
+        # thresh only holds 0/255, so one non-zero count gives both totals
+        white_pixels = cv2.countNonZero(thresh)
         print(f"After morphological operations:")
-        print(f"  White pixels (255): {np.sum(thresh == 255)}")
-        print(f"  Black pixels (0): {np.sum(thresh == 0)}")
+        print(f"  White pixels (255): {white_pixels}")
+        print(f"  Black pixels (0): {thresh.size - white_pixels}")
     
     if debug_mode:
         print(f"Thresholded image shape: {thresh.shape}")
         print(f"Thresholded image unique values: {np.unique(thresh)}")
-        print(f"White pixels (255): {np.sum(thresh == 255)}")
-        print(f"Black pixels (0): {np.sum(thresh == 0)}")
+        print(f"White pixels (255): {white_pixels}")
+        print(f"Black pixels (0): {thresh.size - white_pixels}")
     
     expected_bubbles = num_questions * num_options
     
@@ -417,49 +729,54 @@ def process_omr_sheet(
         if debug_mode:
             print(f"Multi-scale detection failed (score: {detection_result['score'] if detection_result else 'None'}), using fallback method")
         
-        cnts, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Reuse the contours found by the multi-scale pass
+        stats = detection_result.get('contour_stats') or contour_stats(thresh)
+        cnts = stats[0]
         if debug_mode:
             print(f"Fallback: Found {len(cnts)} total contours")
         
-        question_cnts = []
-        for c in cnts:
-            (x, y, w, h) = cv2.boundingRect(c)
-            ar = w / float(h)
-            if w >= 4 and h >= 4 and 0.5 <= ar <= 1.5:
-                question_cnts.append(c)
+        bubble_indices = np.flatnonzero(bubble_mask(stats, 4, None, (0.5, 1.5)))
         
         if debug_mode:
-            print(f"Fallback: After size filtering: {len(question_cnts)} bubbles")
+            print(f"Fallback: After size filtering: {len(bubble_indices)} bubbles")
         
         # If still not enough, try aggressive filtering
-        if len(question_cnts) < expected_bubbles * 0.5:
+        if len(bubble_indices) < expected_bubbles * 0.5:
             if debug_mode:
                 print("Fallback: Trying aggressive filtering")
-            question_cnts = []
-            for c in cnts:
-                (x, y, w, h) = cv2.boundingRect(c)
-                ar = w / float(h)
-                if w >= 3 and h >= 3 and 0.3 <= ar <= 2.0:
-                    question_cnts.append(c)
+            bubble_indices = np.flatnonzero(bubble_mask(stats, 3, None, (0.3, 2.0)))
+            
+            if debug_mode:
+                print(f"Fallback: After aggressive filtering: {len(bubble_indices)} bubbles")
+        
+        # Without an upper size bound the fallback also picks up specks; when
+        # there are more candidates than bubbles, keep those close to the
+        # typical bubble width
+        if len(bubble_indices) > expected_bubbles:
+            widths = stats[2][bubble_indices]
+            median_width = np.median(widths)
+            bubble_indices = bubble_indices[np.abs(widths - median_width) <= FALLBACK_WIDTH_TOLERANCE * median_width]
             
             if debug_mode:
-                print(f"Fallback: After aggressive filtering: {len(question_cnts)} bubbles")
+                print(f"Fallback: After dropping outlier sizes: {len(bubble_indices)} bubbles")
     else:
         # Use the best result from multi-scale detection
-        question_cnts = detection_result['bubbles']
+        stats = detection_result['contour_stats']
+        cnts = stats[0]
+        bubble_indices = detection_result['bubble_indices']
         if debug_mode:
             print(f"Multi-scale detection successful: {detection_result['count']} bubbles found")
     
-    found_bubbles = len(question_cnts)
+    found_bubbles = len(bubble_indices)
     
     # Debug information
     if debug_mode:
         print(f"Debug: Found {found_bubbles} bubbles, expected {expected_bubbles}")
         print(f"Debug: Image dimensions: {width}x{height}")
         print(f"Debug: Total contours found: {len(cnts)}")
-        print(f"Debug: Bubble size range: min_w={min([cv2.boundingRect(c)[2] for c in question_cnts]) if question_cnts else 0}, max_w={max([cv2.boundingRect(c)[2] for c in question_cnts]) if question_cnts else 0}")
+        print(f"Debug: Bubble size range: min_w={stats[2][bubble_indices].min() if found_bubbles else 0}, max_w={stats[2][bubble_indices].max() if found_bubbles else 0}")
     
-    if found_bubbles < expected_bubbles:
+    if found_bubbles < expected_bubbles * MIN_FOUND_BUBBLE_FRACTION:
         # More informative error message
         error_msg = (
             f"Found {found_bubbles} bubbles, but expected {expected_bubbles}. "
@@ -473,48 +790,66 @@ def process_omr_sheet(
         raise OMRProcessingError(error_msg)
     
     # 4. Sort Bubbles into Rows and Extract Responses
-    question_cnts = contours.sort_contours(question_cnts, method="top-to-bottom")[0]
+    # Fill all bubbles into one mask in a single call. They are distinct external
+    # contours, so each fills into its own connected component, and labeling the
+    # mask yields every bubble's centroid as arrays, without per-bubble objects
+    bubble_fill = np.zeros(thresh.shape, dtype=np.uint8)
+    cv2.drawContours(bubble_fill, [cnts[i] for i in bubble_indices], -1, 255, -1)
+    num_labels, labels, _, centroids = cv2.connectedComponentsWithStats(bubble_fill, connectivity=8)
+    
+    # Printed bubble outlines are thin next to a filled bubble; a kernel a third
+    # of a bubble wide separates the two, both when measuring the marks and
+    # when counting marked pixels below
+    bubble_width = int(np.median(stats[2][bubble_indices]))
+    outline_size = max(3, bubble_width // 3)
+    outline_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (outline_size, outline_size))
+    
+    # The 21px block used to find the contours only keeps ink near edges, so a
+    # filled bubble wider than it comes out hollow, and any local mean is pulled
+    # down by neighbouring marks. Fill is counted on a black-hat image instead,
+    # whose closing estimates the paper with the marks removed
+    paper_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (INK_KERNEL_BUBBLES * bubble_width,) * 2)
+    darkness = cv2.morphologyEx(enhanced, cv2.MORPH_BLACKHAT, paper_kernel)
+    ink_threshold = ink_offset(enhanced, labels, num_labels, cv2.erode(bubble_fill, outline_kernel))
+    _, ink = cv2.threshold(darkness, ink_threshold, 255, cv2.THRESH_BINARY)
+    
+    # Outlines keep their printed thickness on the black-hat image; the opening
+    # removes them, so an empty outline counts no marked pixels
+    ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, outline_kernel)
     
     responses = {}
     confidence_scores = {}
-    total_rows_to_process = min(num_questions, found_bubbles // num_options)
     
-    for q_idx in range(total_rows_to_process):
-        i = q_idx * num_options
-        # Sort the contours for the current question from left to right
-        cnts = contours.sort_contours(question_cnts[i:i + num_options])[0]
-        
-        bubbled_pixel_count = -1
-        marked_index = -1
-        all_pixel_counts = []
-        
-        for opt_idx, c in enumerate(cnts):
-            mask = np.zeros(thresh.shape, dtype="uint8")
-            cv2.drawContours(mask, [c], -1, 255, -1)
-            mask = cv2.bitwise_and(thresh, thresh, mask=mask)
-            total_pixels = cv2.countNonZero(mask)
-            all_pixel_counts.append(total_pixels)
-            
-            if total_pixels > bubbled_pixel_count:
-                bubbled_pixel_count = total_pixels
-                marked_index = opt_idx
-        
-        # Calculate confidence score
-        if len(all_pixel_counts) > 1:
-            sorted_counts = sorted(all_pixel_counts, reverse=True)
-            if sorted_counts[0] > 0:
-                confidence = (sorted_counts[0] - sorted_counts[1]) / sorted_counts[0]
-                confidence_scores[str(q_idx + 1)] = round(confidence, 3)
-            else:
-                confidence_scores[str(q_idx + 1)] = 0.0
-        else:
-            confidence_scores[str(q_idx + 1)] = 1.0
-        
-        answer = "No Response"
-        if bubbled_pixel_count > min_pixel_threshold:
-            answer = chr(ord('A') + marked_index)
-        
-        responses[str(q_idx + 1)] = answer
+    # Place every bubble in a question row and option column of the grid, so
+    # a missed faint outline or a mark split in two does not shift the bubbles
+    # of the rows after it
+    centroids = centroids[1:]
+    bubble_height = int(np.median(stats[3][bubble_indices]))
+    rows, cols = grid_cells(centroids, bubble_height, num_options)
+    row_ys = np.bincount(rows, weights=centroids[:, 1]) / np.maximum(np.bincount(rows), 1)
+    col_xs = np.bincount(cols, weights=centroids[:, 0], minlength=num_options) / np.maximum(np.bincount(cols, minlength=num_options), 1)
+    
+    # Marked pixels per cell from the ink blobs; a mark is counted in the cell
+    # it sits on even when it bled past its outline and was not kept as a bubble
+    _, _, ink_stats, ink_centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    ink_stats, ink_centroids = ink_stats[1:], ink_centroids[1:]
+    ink_rows = _nearest(row_ys, ink_centroids[:, 1])
+    ink_cols = _nearest(col_xs, ink_centroids[:, 0])
+    on_grid = (
+        (np.abs(ink_centroids[:, 1] - row_ys[ink_rows]) <= bubble_height / 2)
+        & (np.abs(ink_centroids[:, 0] - col_xs[ink_cols]) <= bubble_width / 2)
+    )
+    total_rows_to_process = min(num_questions, len(row_ys))
+    areas = np.zeros((len(row_ys), num_options), dtype=np.int64)
+    np.add.at(areas, (ink_rows[on_grid], ink_cols[on_grid]), ink_stats[on_grid, cv2.CC_STAT_AREA])
+    areas = areas[:total_rows_to_process]
+    
+    marked, confidences, answered = score_responses(areas, min_pixel_threshold)
+    
+    for q_idx, (marked_index, confidence, is_answered) in enumerate(zip(marked.tolist(), confidences.tolist(), answered.tolist())):
+        question = str(q_idx + 1)
+        confidence_scores[question] = round(confidence, 3)
+        responses[question] = chr(ord('A') + marked_index) if is_answered else "No Response"
     
     processing_time = round(time.time() - start_time, 3)
     
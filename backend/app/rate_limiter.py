@@ -1,76 +1,128 @@
+import math
 import time
-from typing import Dict, Tuple
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
 from fastapi import Request, HTTPException
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+# Internal clients (probes, local tooling) that are never throttled, matched
+# against the socket peer address only
+ALLOW_IPS = frozenset({"127.0.0.1", "::1"})
+
 class RateLimiter:
-    """Simple in-memory rate limiter"""
+    """Simple in-memory token-bucket rate limiter"""
     
-    def __init__(self, requests_per_minute: int = 60, requests_per_hour: int = 1000):
+    def __init__(self, requests_per_minute: int = 60, requests_per_hour: int = 1000, allow_ips: Iterable[str] = ALLOW_IPS):
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
-        self.minute_requests: Dict[str, list] = defaultdict(list)
-        self.hour_requests: Dict[str, list] = defaultdict(list)
+        self._minute_refill_rate = requests_per_minute / 60
+        self._hour_refill_rate = requests_per_hour / 3600
+        # Per-IP (minute_tokens, hour_tokens, last_refill); only touched from
+        # the event loop thread, so a plain dict needs no locking
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        # A bucket idle this long has refilled completely and can be dropped
+        self._idle_ttl = 3600
+        self._last_eviction = time.monotonic()
+        # Allow-listed peer addresses
+        self.allow_ips: FrozenSet[str] = frozenset(allow_ips)
     
     def _get_client_ip(self, request: Request) -> str:
         """Extract client IP from request"""
         # Check for forwarded headers (for proxy/load balancer setups)
-        forwarded_for = request.headers.get("X-Forwarded-For")
+        headers = request.headers
+        forwarded_for = headers.get("x-forwarded-for")
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+            return forwarded_for.split(",", 1)[0].strip()
         
-        real_ip = request.headers.get("X-Real-IP")
+        real_ip = headers.get("x-real-ip")
         if real_ip:
             return real_ip
         
         # Fallback to direct connection
         return request.client.host if request.client else "unknown"
     
-    def _cleanup_old_requests(self, client_ip: str):
-        """Remove old requests outside the time windows"""
-        current_time = time.time()
+    def _get_client_ip_from_headers(self, headers: Dict[bytes, bytes], client: Optional[Tuple[str, int]]) -> bytes:
+        """Extract client IP, as raw bytes, from ASGI headers and the scope's client address"""
+        # Check for forwarded headers (for proxy/load balancer setups)
+        forwarded_for = headers.get(b"x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(b",", 1)[0].strip()
         
-        # Clean minute requests (older than 60 seconds)
-        self.minute_requests[client_ip] = [
-            req_time for req_time in self.minute_requests[client_ip]
-            if current_time - req_time < 60
-        ]
+        real_ip = headers.get(b"x-real-ip")
+        if real_ip:
+            return real_ip
         
-        # Clean hour requests (older than 3600 seconds)
-        self.hour_requests[client_ip] = [
-            req_time for req_time in self.hour_requests[client_ip]
-            if current_time - req_time < 3600
-        ]
+        # Fallback to direct connection
+        return client[0].encode() if client else b"unknown"
+    
+    def _evict_idle_buckets(self, current_time: float):
+        """Remove buckets of clients idle long enough to be full again"""
+        self._last_eviction = current_time
+        cutoff = current_time - self._idle_ttl
+        self.buckets = {
+            client_ip: bucket for client_ip, bucket in self.buckets.items()
+            if bucket[2] > cutoff
+        }
     
     def is_allowed(self, request: Request) -> Tuple[bool, Dict[str, int]]:
         """Check if request is allowed based on rate limits"""
-        client_ip = self._get_client_ip(request)
-        current_time = time.time()
+        return self._check(self._get_client_ip(request))
+    
+    def is_allowed_asgi(self, headers: Dict[bytes, bytes], client: Optional[Tuple[str, int]]) -> Tuple[bool, Optional[Dict[str, int]]]:
+        """Check if a raw ASGI request is allowed based on rate limits
         
-        # Clean up old requests
-        self._cleanup_old_requests(client_ip)
+        Usage info is only built for rejected requests; allowed ones get None.
+        Allow-listed clients skip the bucket lookup entirely. Forwarding headers
+        are client-supplied, so the allow-list is matched against the socket
+        peer, and only for direct requests: a request relayed by a local proxy
+        carries forwarding headers and is limited by its forwarded address.
+        """
+        if (
+            client is not None
+            and client[0] in self.allow_ips
+            and b"x-forwarded-for" not in headers
+            and b"x-real-ip" not in headers
+        ):
+            return True, None
+        
+        client_ip = self._get_client_ip_from_headers(headers, client)
+        return self._check(client_ip.decode("latin-1"), always_report=False)
+    
+    def _check(self, client_ip: str, always_report: bool = True) -> Tuple[bool, Optional[Dict[str, int]]]:
+        """Consume a token for the client and report its current usage"""
+        current_time = time.monotonic()
         
-        # Add current request
-        self.minute_requests[client_ip].append(current_time)
-        self.hour_requests[client_ip].append(current_time)
+        # Periodically drop idle buckets to bound memory
+        if current_time - self._last_eviction >= self._idle_ttl:
+            self._evict_idle_buckets(current_time)
         
-        # Check limits
-        minute_count = len(self.minute_requests[client_ip])
-        hour_count = len(self.hour_requests[client_ip])
+        # Refill tokens for the time elapsed since the last request
+        bucket = self.buckets.get(client_ip)
+        if bucket is None:
+            minute_tokens = float(self.requests_per_minute)
+            hour_tokens = float(self.requests_per_hour)
+        else:
+            minute_tokens, hour_tokens, last_refill = bucket
+            elapsed = current_time - last_refill
+            minute_tokens = min(self.requests_per_minute, minute_tokens + elapsed * self._minute_refill_rate)
+            hour_tokens = min(self.requests_per_hour, hour_tokens + elapsed * self._hour_refill_rate)
         
-        minute_allowed = minute_count <= self.requests_per_minute
-        hour_allowed = hour_count <= self.requests_per_hour
+        # Check limits and consume a token from each bucket
+        is_allowed = minute_tokens >= 1 and hour_tokens >= 1
+        if is_allowed:
+            minute_tokens -= 1
+            hour_tokens -= 1
+        self.buckets[client_ip] = (minute_tokens, hour_tokens, current_time)
         
-        is_allowed = minute_allowed and hour_allowed
+        if is_allowed and not always_report:
+            return True, None
         
         limits_info = {
-            "minute_requests": minute_count,
+            "minute_requests": math.ceil(self.requests_per_minute - minute_tokens),
             "minute_limit": self.requests_per_minute,
-            "hour_requests": hour_count,
+            "hour_requests": math.ceil(self.requests_per_hour - hour_tokens),
             "hour_limit": self.requests_per_hour
         }
         
@@ -0,0 +1,58 @@
+import time
+from typing import Any, Tuple
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+import msgpack
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# Negotiated responses differ by Accept header, which caches must key on
+NEGOTIATED_HEADERS = {"Vary": "Accept"}
+
+# OpenAPI `responses` entry advertising the MessagePack variant of a negotiated endpoint
+MSGPACK_OPENAPI_RESPONSES = {200: {"content": {MSGPACK_MEDIA_TYPE: {}}}}
+
+# (second, str, bytes) of the last formatted timestamp, swapped atomically
+_timestamp_cache: Tuple[int, str, bytes] = (0, "", b"")
+
+
+def _timestamp() -> Tuple[int, str, bytes]:
+    """Return the cached local timestamp, reformatting at most once per second"""
+    global _timestamp_cache
+    sec = int(time.time())
+    cache = _timestamp_cache
+    if cache[0] != sec:
+        text = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(sec))
+        cache = _timestamp_cache = (sec, text, text.encode())
+    return cache
+
+
+def iso_now() -> str:
+    """Current local time as an ISO 8601 string with second resolution"""
+    return _timestamp()[1]
+
+
+def iso_now_bytes() -> bytes:
+    """Current local time as ISO 8601 bytes, for splicing into pre-serialized bodies"""
+    return _timestamp()[2]
+
+
+class MsgpackResponse(Response):
+    """Response rendered as MessagePack for clients that request it"""
+    
+    media_type = MSGPACK_MEDIA_TYPE
+    
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+def accepts_msgpack(request: Request) -> bool:
+    """Check whether the client asked for a MessagePack response"""
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def negotiated_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Return MessagePack if the client accepts it, JSON otherwise"""
+    if accepts_msgpack(request):
+        return MsgpackResponse(content=content, status_code=status_code, headers=NEGOTIATED_HEADERS)
+    return ORJSONResponse(content=content, status_code=status_code, headers=NEGOTIATED_HEADERS)
@@ -1,7 +1,9 @@
+import hashlib
+import heapq
+import itertools
+import secrets
 import time
-from typing import Dict, Optional, Any
-from datetime import datetime, timedelta
-import uuid
+from typing import Dict, List, Optional, Any, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,16 +14,30 @@ class ResultStore:
     def __init__(self, expiration_hours: int = 24):
         self.results: Dict[str, Dict[str, Any]] = {}
         self.expiration_hours = expiration_hours
+        self._expiration_seconds = expiration_hours * 3600
+        # Min-heap of (expires_at, result_id) on the monotonic clock; entries for
+        # results that were deleted early are skipped when they reach the top
+        self._expiry_heap: List[Tuple[float, str]] = []
+        # Result IDs are a keyed hash of a per-process counter: unique, not
+        # guessable without the key, and no OS entropy read per result
+        self._id_key = secrets.token_bytes(16)
+        self._id_counter = itertools.count()
     
     def store_result(self, result_data: Dict[str, Any]) -> str:
         """Store a result and return its ID"""
-        result_id = str(uuid.uuid4())
+        result_id = hashlib.blake2b(
+            next(self._id_counter).to_bytes(8, "little"), key=self._id_key, digest_size=16
+        ).hexdigest()
+        # Wall-clock creation time; expiry uses the monotonic clock so it is
+        # a plain float compare and unaffected by system clock changes
+        expires_at = time.monotonic() + self._expiration_seconds
         
         self.results[result_id] = {
             "data": result_data,
-            "created_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(hours=self.expiration_hours)
+            "created_at": time.time(),
+            "expires_at": expires_at
         }
+        heapq.heappush(self._expiry_heap, (expires_at, result_id))
         
         logger.info(f"Stored result with ID: {result_id}")
         return result_id
@@ -34,7 +50,7 @@ class ResultStore:
         result = self.results[result_id]
         
         # Check if expired
-        if datetime.now() > result["expires_at"]:
+        if time.monotonic() > result["expires_at"]:
             del self.results[result_id]
             logger.info(f"Result {result_id} expired and was removed")
             return None
@@ -50,34 +66,51 @@ class ResultStore:
             return True
         return False
     
+    def _is_live(self, expires_at: float, result_id: str) -> bool:
+        """Whether a heap entry still refers to a stored result"""
+        result = self.results.get(result_id)
+        return result is not None and result["expires_at"] == expires_at
+    
     def cleanup_expired(self) -> int:
         """Remove expired results and return count of removed items"""
-        current_time = datetime.now()
-        expired_ids = [
-            result_id for result_id, result in self.results.items()
-            if current_time > result["expires_at"]
-        ]
+        current_time = time.monotonic()
+        heap = self._expiry_heap
+        removed = 0
         
-        for result_id in expired_ids:
-            del self.results[result_id]
+        # Only entries past their expiry are popped; the rest of the store is untouched
+        while heap and current_time > heap[0][0]:
+            expires_at, result_id = heapq.heappop(heap)
+            if self._is_live(expires_at, result_id):
+                del self.results[result_id]
+                removed += 1
         
-        if expired_ids:
-            logger.info(f"Cleaned up {len(expired_ids)} expired results")
+        if removed:
+            logger.info(f"Cleaned up {removed} expired results")
         
-        return len(expired_ids)
+        return removed
+    
+    def _count_expired(self, current_time: float) -> int:
+        """Count stored results past their expiry, visiting only expired heap entries"""
+        heap = self._expiry_heap
+        count = 0
+        # Children of an unexpired entry expire no earlier, so their subtrees are skipped
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            expires_at, result_id = heap[i]
+            if current_time > expires_at:
+                count += self._is_live(expires_at, result_id)
+                stack.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(heap))
+        return count
     
     def get_stats(self) -> Dict[str, Any]:
         """Get store statistics"""
-        current_time = datetime.now()
-        active_results = len(self.results)
-        expired_results = sum(
-            1 for result in self.results.values()
-            if current_time > result["expires_at"]
-        )
+        total_results = len(self.results)
+        expired_results = self._count_expired(time.monotonic())
         
         return {
-            "total_results": active_results + expired_results,
-            "active_results": active_results,
+            "total_results": total_results,
+            "active_results": total_results - expired_results,
             "expired_results": expired_results,
             "expiration_hours": self.expiration_hours
         }
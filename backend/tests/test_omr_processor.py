@@ -0,0 +1,118 @@
+import random
+import struct
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from app.omr_processor import process_omr_sheet, validate_image_file
+
+
+def make_sheet(radius: int, num_questions: int = 20, num_options: int = 4, seed: int = 0, upscale: int = 1, mark_shade: int = 20):
+    """Render a photographed answer sheet: dark bubble outlines on white paper, marks filled in"""
+    rng = random.Random(seed)
+    pitch = radius * 3
+    width = 400 + num_options * pitch
+    height = 160 + num_questions * pitch
+    page = np.full((height, width, 3), 245, np.uint8)
+    answers = {}
+    for q in range(num_questions):
+        y = 80 + q * pitch
+        mark = rng.randrange(-1, num_options)
+        for o in range(num_options):
+            center = (200 + o * pitch, y)
+            if o == mark:
+                cv2.circle(page, center, radius, (mark_shade, mark_shade, mark_shade), -1)
+            cv2.circle(page, center, radius, (20, 20, 20), 2)
+        answers[str(q + 1)] = chr(ord('A') + mark) if mark >= 0 else "No Response"
+    
+    # Place the page on a darker background with a slight perspective skew
+    image = np.full((height + 200, width + 200, 3), 90, np.uint8)
+    image[100:100 + height, 100:100 + width] = page
+    src = np.float32([[100, 100], [100 + width, 100], [100 + width, 100 + height], [100, 100 + height]])
+    dst = np.float32([[120, 90], [90 + width, 110], [120 + width, 85 + height], [95, 105 + height]])
+    image = cv2.warpPerspective(image, cv2.getPerspectiveTransform(src, dst), image.shape[1::-1], borderValue=(90, 90, 90))
+    if upscale != 1:
+        image = cv2.resize(image, None, fx=upscale, fy=upscale)
+    return cv2.imencode(".png", image)[1].tobytes(), answers
+
+
+@pytest.mark.parametrize("radius, upscale, min_pixel_threshold", [
+    (11, 1, 150),
+    # Bubbles wider than the adaptive threshold block: filled ones must not be
+    # read as hollow, and empty outlines must not count as marked
+    (30, 1, 500),
+    (14, 3, 500),
+])
+def test_reads_marked_and_blank_answers(radius, upscale, min_pixel_threshold):
+    image_bytes, answers = make_sheet(radius, seed=radius, upscale=upscale)
+    
+    result = process_omr_sheet(image_bytes, len(answers), 4, min_pixel_threshold)
+    
+    assert result["responses"] == answers
+
+
+@pytest.mark.parametrize("radius, min_pixel_threshold", [
+    (7, 100),
+    (11, 150),
+    (30, 500),
+])
+def test_reads_faint_marks_inside_dark_outlines(radius, min_pixel_threshold):
+    # Pencil marks far lighter than the printed outlines must still count as filled
+    image_bytes, answers = make_sheet(radius, seed=radius, mark_shade=150)
+    
+    result = process_omr_sheet(image_bytes, len(answers), 4, min_pixel_threshold)
+    
+    assert result["responses"] == answers
+
+
+# Answers to questions 1-45 on the first column of the sample scans
+SAMPLE_ANSWERS = "D B B C B A C D A A A D A B C D C C B A - - - - - - A C C A B - B C - A D A B - - C C A C".split()
+
+
+@pytest.mark.parametrize("filename, crop", [
+    ("omr.jpeg", (slice(95, 840), slice(40, 118))),
+    ("omr2.jpeg", (slice(138, 880), slice(175, 252))),
+])
+def test_reads_scanned_sheet(filename, crop):
+    scan = cv2.imread(str(Path(__file__).parent.parent / filename))
+    image_bytes = cv2.imencode(".png", scan[crop])[1].tobytes()
+    
+    result = process_omr_sheet(image_bytes, len(SAMPLE_ANSWERS), 4, 150)
+    
+    assert result["responses"] == {
+        str(q + 1): "No Response" if answer == "-" else answer
+        for q, answer in enumerate(SAMPLE_ANSWERS)
+    }
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def test_rejects_decompression_bomb():
+    # A quarter-megabyte PNG that decodes to 16000x16000 pixels
+    width = height = 16000
+    image_bytes = (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + png_chunk(b"IDAT", zlib.compress(b"\x00" * ((width + 1) * height), 9))
+        + png_chunk(b"IEND", b"")
+    )
+    
+    is_valid, error_message = validate_image_file(image_bytes)
+    
+    assert not is_valid
+    assert "exceeds limit" in error_message
+
+
+@pytest.mark.parametrize("extension", [".png", ".jpg"])
+def test_rejects_truncated_image(extension):
+    image_bytes = cv2.imencode(extension, np.full((60, 80, 3), 200, np.uint8))[1].tobytes()
+    
+    assert validate_image_file(image_bytes) == (True, "")
+    assert not validate_image_file(image_bytes[:len(image_bytes) // 2])[0]
+    # Header only, no image data
+    assert not validate_image_file(image_bytes[:33])[0]